@@ -10,20 +10,41 @@ Settings fields used:
 
 Add future providers (google, anthropic, databricks) by extending _build_client.
 """
-from typing import List, Dict, Any, Protocol
+from typing import Iterator, List, Dict, Any, Protocol
 from app.core.config import get_settings
+import atexit
 import httpx
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Shared HTTP client: keep-alive + HTTP/2 avoid per-request connection setup.
+# Safe to share across chat clients; get_chat_client caches instances anyway.
+_HTTP = httpx.Client(
+    timeout=120,
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=30.0),
+)
+atexit.register(_HTTP.close)
+
+# Async twin of _HTTP for serving completions without blocking the event loop.
+_AHTTP = httpx.AsyncClient(
+    timeout=120,
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=30.0),
+)
+
 try:
-    from openai import OpenAI  # lightweight; only used if provider_chat=openai
+    from openai import OpenAI, AsyncOpenAI  # lightweight; only used if provider_chat=openai
 except ImportError:  # pragma: no cover
     OpenAI = None  # type: ignore
+    AsyncOpenAI = None  # type: ignore
 
 class ChatClientLike(Protocol):
     def complete(self, messages: List[Dict[str, str]]) -> str: ...
+    async def acomplete(self, messages: List[Dict[str, str]]) -> str: ...
+    def stream_complete(self, messages: List[Dict[str, str]]) -> Iterator[str]: ...
 
 _singletons: dict[str, ChatClientLike] = {}
 
@@ -34,6 +55,7 @@ class OllamaChatClient:
         self.model = model
         self.timeout = timeout
         self.temperature = temperature
+        self._http = _HTTP
 
     def complete(self, messages: List[Dict[str, str]]) -> str:
         payload = {
@@ -44,10 +66,9 @@ class OllamaChatClient:
         if self.temperature is not None:
             payload["temperature"] = self.temperature
         url = f"{self.base_url}/api/chat"
-        with httpx.Client(timeout=self.timeout) as client:
-            r = client.post(url, json=payload)
-            r.raise_for_status()
-            data = r.json()
+        r = self._http.post(url, json=payload, timeout=self.timeout)
+        r.raise_for_status()
+        data = r.json()
         if isinstance(data, dict):
             if "message" in data and isinstance(data["message"], dict):
                 return data["message"].get("content", "")
@@ -55,12 +76,66 @@ class OllamaChatClient:
                 return str(data["response"])
         return str(data)[:8000]
 
+    async def acomplete(self, messages: List[Dict[str, str]]) -> str:
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": False
+        }
+        if self.temperature is not None:
+            payload["temperature"] = self.temperature
+        url = f"{self.base_url}/api/chat"
+        r = await _AHTTP.post(url, json=payload, timeout=self.timeout)
+        r.raise_for_status()
+        data = r.json()
+        if isinstance(data, dict):
+            if "message" in data and isinstance(data["message"], dict):
+                return data["message"].get("content", "")
+            if "response" in data:
+                return str(data["response"])
+        return str(data)[:8000]
+
+    def stream_complete(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": True
+        }
+        if self.temperature is not None:
+            payload["temperature"] = self.temperature
+        url = f"{self.base_url}/api/chat"
+        with self._http.stream("POST", url, json=payload, timeout=self.timeout) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    continue
+                msg = data.get("message")
+                if isinstance(msg, dict):
+                    delta = msg.get("content", "")
+                    if delta:
+                        yield delta
+                if data.get("done"):
+                    break
+
 
 class OpenAIChatClient:
     def __init__(self, api_key: str, model: str, timeout: float = 120, temperature: float | None = None):
         if OpenAI is None:
             raise RuntimeError("openai package not installed (pip install openai)")
-        self.client = OpenAI(api_key=api_key)
+        # Explicit pooled transport: the SDK's default client would otherwise
+        # be built with conservative pool settings and no HTTP/2.
+        self._http = httpx.Client(
+            timeout=timeout,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=30.0),
+        )
+        atexit.register(self._http.close)
+        self.client = OpenAI(api_key=api_key, http_client=self._http)
+        self.aclient = AsyncOpenAI(api_key=api_key, http_client=_AHTTP) if AsyncOpenAI else None
         self.model = model
         self.timeout = timeout
         self.temperature = temperature
@@ -76,6 +151,28 @@ class OpenAIChatClient:
         except Exception:
             return str(resp)[:8000]
 
+    async def acomplete(self, messages: List[Dict[str, str]]) -> str:
+        create_kwargs = {"model": self.model, "messages": messages}
+        if self.temperature is not None:
+            create_kwargs["temperature"] = self.temperature
+        resp = await self.aclient.chat.completions.create(**create_kwargs)
+        try:
+            return resp.choices[0].message.content
+        except Exception:
+            return str(resp)[:8000]
+
+    def stream_complete(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        create_kwargs = {"model": self.model, "messages": messages, "stream": True}
+        if self.temperature is not None:
+            create_kwargs["temperature"] = self.temperature
+        for chunk in self.client.chat.completions.create(**create_kwargs):
+            try:
+                delta = chunk.choices[0].delta.content
+            except (AttributeError, IndexError):
+                continue
+            if delta:
+                yield delta
+
 
 def _build_client(settings) -> ChatClientLike:
     prov = settings.provider_chat.lower()
@@ -109,3 +206,18 @@ def chat_complete(messages: List[Dict[str, str]]) -> str:
     """
     client = get_chat_client()
     return client.complete(messages)
+
+
+async def achat_complete(messages: List[Dict[str, str]]) -> str:
+    """Async counterpart of chat_complete; never blocks the event loop."""
+    client = get_chat_client()
+    return await client.acomplete(messages)
+
+
+def chat_stream(messages: List[Dict[str, str]]) -> Iterator[str]:
+    """
+    Yield assistant text deltas as they arrive instead of buffering the full
+    response; cuts time-to-first-token from total generation time to ~one RTT.
+    """
+    client = get_chat_client()
+    return client.stream_complete(messages)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+"""
+In-process LRU+TTL cache for retrieval results.
+
+Repeat / near-duplicate queries are common in RAG traffic; caching the
+(query embedding, search results) pair avoids one embedding call and one
+vector search per repeat turn. Entries are keyed per tenant so ingestion
+can invalidate a single tenant's entries when new documents land.
+Not persistent; promote to Redis later if multiple workers need to share it.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple
+
+from app.core.config import get_settings
+
+
+class QueryCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_size: int = 512, ttl_seconds: float = 300.0) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        self._store: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            ts, value = entry
+            if now - ts > self.ttl_seconds:
+                del self._store[key]
+                self.misses += 1
+                return None
+            self._store.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._store[key] = (time.monotonic(), value)
+            self._store.move_to_end(key)
+            while len(self._store) > self.max_size:
+                self._store.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_tenant(self, tenant_id: str) -> int:
+        """Drop all entries whose key starts with tenant_id (keys are tuples)."""
+        with self._lock:
+            stale = [k for k in self._store if isinstance(k, tuple) and k and k[0] == tenant_id]
+            for k in stale:
+                del self._store[k]
+            return len(stale)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._store),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_cache: QueryCache | None = None
+
+
+def get_query_cache() -> QueryCache:
+    global _cache
+    if _cache is None:
+        s = get_settings()
+        _cache = QueryCache(max_size=s.query_cache_max_size, ttl_seconds=s.query_cache_ttl_seconds)
+    return _cache
+
+
+def make_key(tenant_id: str, query: str, top_k: int, source_ids: list[str] | None) -> Tuple:
+    return (tenant_id, query.strip().lower(), top_k, tuple(source_ids) if source_ids else None)
+
+
+def invalidate_tenant(tenant_id: str) -> None:
+    """Called by ingestion after new vectors are written for a tenant."""
+    if _cache is not None:
+        _cache.invalidate_tenant(tenant_id)
+
+
+def cache_stats() -> dict[str, int]:
+    return get_query_cache().stats()
@@ -1,23 +1,71 @@
 from __future__ import annotations
+import asyncio
+import hashlib
+import logging
+import re
+import threading
 import uuid
 import httpx
-from typing import List, Dict, Any, Tuple
-from app.core.db import fetch_one, fetch_all, execute
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+from typing import Iterator, List, Dict, Any, Tuple
+from app.core.db import fetch_one, fetch_all, execute, run_pipeline
 
 from app.core.config import get_settings
 from app.embeddings.factory import get_embedding_service
 from app.vector.qdrant_store import get_vector_store
-from app.chat.model_factory import chat_complete
+from app.chat.model_factory import chat_complete, achat_complete, chat_stream
+from app.chat.query_cache import get_query_cache, make_key
+from app.chat.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+# Shared pool for overlapping independent IO (DB round-trips vs embedding calls)
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-chat")
+
+# Embedding-only cache keyed by a hash of the whitespace/case-normalized query.
+# Complements the query cache: hits here still need a vector search (top_k or
+# source_ids may differ) but skip the embedding call. blake2b is faster than
+# SHA-256 for short strings and plenty for a cache key.
+_EMBED_CACHE_MAX = 10_000
+_embed_cache: OrderedDict[bytes, List[float]] = OrderedDict()
+_embed_cache_lock = threading.Lock()
+
+
+def _cached_embed_query(embeddings: Any, text: str) -> List[float]:
+    norm = " ".join(text.split()).lower()
+    key = hashlib.blake2b(norm.encode("utf-8"), digest_size=16).digest()
+    with _embed_cache_lock:
+        emb = _embed_cache.get(key)
+        if emb is not None:
+            _embed_cache.move_to_end(key)
+            return emb
+    emb = embeddings.embed_query(text)
+    with _embed_cache_lock:
+        _embed_cache[key] = emb
+        _embed_cache.move_to_end(key)
+        while len(_embed_cache) > _EMBED_CACHE_MAX:
+            _embed_cache.popitem(last=False)
+    return emb
+
 # -------- Postgres Conversation Persistence --------
 
+# Only the last N turns ever reach the prompt; fetching more wastes IO on
+# long sessions (room for ~20 user/assistant pairs).
+HISTORY_LOAD_LIMIT = 40
+
+_HISTORY_SQL = (
+    "SELECT role, content FROM chat_messages "
+    "WHERE tenant_id=%s AND session_id=%s ORDER BY turn_index DESC LIMIT %s"
+)
+
 def load_session(tenant_id: str, session_id: str) -> List[Dict[str, str]]:
-    rows = fetch_all(
-        "SELECT role, content FROM chat_messages WHERE tenant_id=%s AND session_id=%s ORDER BY turn_index",
-        tenant_id, session_id
-    )
+    rows = fetch_all(_HISTORY_SQL, tenant_id, session_id, HISTORY_LOAD_LIMIT)
+    rows.reverse()  # newest-first fetch, chronological order for the prompt
     return [{"role": r["role"], "content": r["content"]} for r in rows]
 
 def ensure_session(tenant_id: str, session_id: str) -> None:
@@ -26,55 +74,217 @@ def ensure_session(tenant_id: str, session_id: str) -> None:
         tenant_id, session_id
     )
 
+def ensure_and_load_session(tenant_id: str, session_id: str, include_history: bool) -> List[Dict[str, str]]:
+    """
+    Ensure the session row exists and (optionally) load its history in a single
+    pipelined round-trip instead of two sequential ones.
+    """
+    statements = [
+        (
+            "INSERT INTO chat_sessions (tenant_id, session_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+            (tenant_id, session_id),
+        )
+    ]
+    if include_history:
+        statements.append((_HISTORY_SQL, (tenant_id, session_id, HISTORY_LOAD_LIMIT)))
+    results = run_pipeline(statements)
+    if not include_history:
+        return []
+    rows = results[1] or []
+    rows.reverse()  # newest-first fetch, chronological order for the prompt
+    return [{"role": r["role"], "content": r["content"]} for r in rows]
+
 def append_messages(tenant_id: str, session_id: str, new_messages: List[Dict[str, str]]) -> None:
-    # Get current max turn_index
-    row = fetch_one(
-        "SELECT COALESCE(MAX(turn_index), -1) AS max_idx FROM chat_messages WHERE tenant_id=%s AND session_id=%s",
-        tenant_id, session_id
+    if not new_messages:
+        return
+    # Single round-trip: fold the MAX(turn_index) lookup into the INSERT and
+    # expand the message batch server-side via unnest (arrays keep ordering).
+    roles = [m["role"] for m in new_messages]
+    contents = [m["content"] for m in new_messages]
+    execute(
+        """
+        INSERT INTO chat_messages (tenant_id, session_id, turn_index, role, content)
+        SELECT %s, %s,
+               COALESCE((SELECT MAX(turn_index) FROM chat_messages
+                         WHERE tenant_id=%s AND session_id=%s), -1) + r.i,
+               r.role, r.content
+        FROM unnest(%s::text[], %s::text[]) WITH ORDINALITY AS r(role, content, i)
+        """,
+        tenant_id, session_id, tenant_id, session_id, roles, contents
     )
-    start_idx = (row["max_idx"] if row else -1) + 1
-    for offset, m in enumerate(new_messages):
-        execute(
-            "INSERT INTO chat_messages (tenant_id, session_id, turn_index, role, content) VALUES (%s, %s, %s, %s, %s)",
-            tenant_id, session_id, start_idx + offset, m["role"], m["content"]
-        )
 
-SYSTEM_TEMPLATE = (
+# Static system prompt kept byte-identical across turns so provider-side
+# prefix caching can hit; the retrieved context travels in its own message.
+SYSTEM_PROMPT = (
     "You are a retrieval-augmented assistant. You MUST use ONLY the provided context chunks to answer.\n"
-    "Do NOT attempt to answer from outside knowledge. Cite sources by filename and chunk id when possible.\n\n"
-    "Context Chunks:\n{context}\n\n"
+    "Do NOT attempt to answer from outside knowledge. Cite sources by filename and chunk id when possible.\n"
     "Answer the user query clearly and concisely. If you must refuse, use the exact phrase above."
 )
 
-def build_context_chunks(results: List[Any], max_chars: int = 8000) -> Tuple[str, List[str], List[str]]:
+CONTEXT_TEMPLATE = "Context Chunks:\n{context}"
+
+def build_context_chunks(results: List[Any], max_chars: int = 8000, max_docs: int | None = None) -> Tuple[str, List[str], List[str]]:
     """
     results: list of SearchResult (id, text, score, metadata)
     Returns: (context_string, citation_ids, source_list)
 
     Notes:
-    - Respect settings.max_context_docs by trimming the candidate results before assembling context.
+    - Respect max_docs (settings.max_context_docs) by trimming the candidate results before assembling context.
     - This reduces prompt size and keeps highest-confidence chunks.
     """
+    if max_docs is None:
+        max_docs = settings.max_context_docs
     # Trim to configured max documents (results are expected ordered by score)
-    trimmed = results[:settings.max_context_docs] if settings.max_context_docs and len(results) > settings.max_context_docs else results
+    trimmed = results[:max_docs] if max_docs and len(results) > max_docs else results
 
-    context_parts: List[str] = []
-    citations: List[str] = []
-    sources: List[str] = []
-    total_len = 0
+    # First pass (SoA): dedupe overlapping hits by (source, chunk_index) and
+    # extract the fields once — wide recall often returns the same chunk twice.
+    seen: set = set()
+    keys: List[Tuple[str, Any]] = []
+    scores: List[float] = []
+    snippets: List[str] = []
     for r in trimmed:
-        source = r.metadata.get("source") or "unknown"
-        cid = f"{source}#chunk{r.metadata.get('chunk_index')}"
-        snippet = r.text[:1200]
-        block = f"[{cid} | score={round(r.score,4)}]\n{snippet}"
-        block_len = len(block)
-        if total_len + block_len > max_chars:
+        md = r.metadata
+        key = (md.get("source") or "unknown", md.get("chunk_index"))
+        if key in seen:
+            continue
+        seen.add(key)
+        keys.append(key)
+        scores.append(r.score)
+        # Truncate by bytes without splitting a multi-byte character
+        snippets.append(r.text.encode("utf-8")[:1200].decode("utf-8", "ignore"))
+
+    # Second pass: format blocks, then find the cutoff in one bisect instead
+    # of a running-total loop
+    cids = [f"{source}#chunk{ci}" for source, ci in keys]
+    blocks = [
+        f"[{cid} | score={round(sc, 4)}]\n{snippet}"
+        for cid, sc, snippet in zip(cids, scores, snippets)
+    ]
+    cumulative = list(accumulate(map(len, blocks)))
+    cut = bisect_right(cumulative, max_chars)
+    # Ordered set of source filenames (dict preserves insertion order)
+    sources: dict[str, None] = {}
+    for source, _ in keys[:cut]:
+        sources[source] = None
+    return "\n\n".join(blocks[:cut]), cids[:cut], list(sources)
+
+
+def _prepare_turn(
+    tenant_id: str,
+    user_message: str,
+    session_id: str | None,
+    top_k: int,
+    include_history: bool,
+    source_ids: List[str] | None = None,
+    persist: bool = True
+) -> Tuple[str | None, List[Any], List[str], List[str], List[Dict[str, str]]]:
+    """
+    Shared front half of the chat pipeline (session, retrieval, prompt build).
+    Returns (session_id, results, citations, sources, llm_messages);
+    llm_messages is empty when retrieval produced no results.
+    When persist=False no session row is created and session_id stays None.
+    """
+    if not session_id:
+        session_id = str(uuid.uuid4()) if persist else None
+
+    # Snapshot settings into locals once per turn instead of repeated pydantic
+    # attribute lookups in the hot path.
+    s = get_settings()
+    max_k = s.max_search_k
+    min_score = s.min_score_threshold
+    max_docs = s.max_context_docs
+    max_history_tokens = s.max_history_tokens
+
+    # Session-ensure + history load is independent of retrieval; run it in the
+    # background so the DB round-trip overlaps the embedding + vector search.
+    # One-shot turns (persist=False) skip the DB entirely.
+    session_future = (
+        _executor.submit(ensure_and_load_session, tenant_id, session_id, include_history)
+        if persist else None
+    )
+
+    embeddings = get_embedding_service()
+    vector_store = get_vector_store()
+
+    # Retrieval (cached: repeat queries skip both embedding and vector search)
+    # Use a wider recall for search then trim context; apply configured score threshold
+    search_top_k = max_k if max_k and max_k > top_k else top_k
+    query_cache = get_query_cache()
+    cache_key = make_key(tenant_id, user_message, search_top_k, source_ids)
+    cached = query_cache.get(cache_key)
+    if cached is not None:
+        query_emb, results = cached
+    else:
+        query_emb = _cached_embed_query(embeddings, user_message)
+        results = vector_store.search(
+            tenant_id=tenant_id,
+            embedding=query_emb,
+            top_k=search_top_k,
+            score_threshold=min_score,
+            source_ids=source_ids
+        )
+        query_cache.put(cache_key, (query_emb, results))
+
+    history_messages = session_future.result() if session_future is not None else []
+
+    context_str, citations, sources = build_context_chunks(results, max_docs=max_docs)
+
+    if not results:
+        return session_id, results, [], [], []
+
+    # Build message list for LLM: fixed system prefix, then retrieved context
+    llm_messages: List[Dict[str, str]] = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": CONTEXT_TEMPLATE.format(context=context_str)},
+    ]
+
+    # Append prior conversation, truncated by real token count
+    history_tokens = 0
+    for m in history_messages[-20:]:
+        history_tokens += count_tokens(m["content"])
+        if history_tokens > max_history_tokens:
             break
-        context_parts.append(block)
-        citations.append(cid)
-        sources.append(source)
-        total_len += block_len
-    return "\n\n".join(context_parts), citations, sources
+        llm_messages.append({"role": m["role"], "content": m["content"]})
+
+    # Current user turn
+    llm_messages.append({"role": "user", "content": user_message})
+
+    # Pre-flight size check: drop oldest history turns (after system + context)
+    # rather than paying for a doomed LLM round-trip.
+    total_chars = sum(len(m["content"]) for m in llm_messages)
+    while total_chars > s.max_context_chars and len(llm_messages) > 3:
+        dropped = llm_messages.pop(2)
+        total_chars -= len(dropped["content"])
+
+    return session_id, results, citations, sources, llm_messages
+
+
+# Matches "i don't know" variants without lowercasing the whole answer
+_UNKNOWN_RE = re.compile(r"i\s*don.?t\s*know", re.IGNORECASE)
+
+CANONICAL_UNKNOWN = "I don't know based on the provided documents."
+
+
+def _normalize_answer(answer: Any) -> str:
+    """
+    Normalise unknown/empty model replies to the exact phrase required by the
+    system prompt so callers get a deterministic response when the model
+    cannot answer from the provided documents.
+    """
+    if isinstance(answer, str):
+        ans_str = answer.strip()
+        # The refusal phrase appears early if at all; bound the regex scan.
+        if not ans_str or _UNKNOWN_RE.search(ans_str[:256]):
+            return CANONICAL_UNKNOWN
+    return answer
+
+
+def _persist_turn(tenant_id: str, session_id: str | None, user_message: str, answer: str) -> None:
+    if session_id is None:
+        return
+    append_messages(tenant_id, session_id, [{"role": "user", "content": user_message},
+                                            {"role": "assistant", "content": answer}])
 
 
 def rag_chat(
@@ -83,7 +293,8 @@ def rag_chat(
     session_id: str | None,
     top_k: int,
     include_history: bool,
-    source_ids: List[str] | None = None
+    source_ids: List[str] | None = None,
+    persist: bool = True
 ) -> Dict[str, Any]:
     """
     Main RAG chat pipeline:
@@ -91,40 +302,15 @@ def rag_chat(
       2. Retrieve top_k chunks for user message
       3. Construct system + history + user messages
       4. Call Ollama chat model
-      5. Persist conversation
+      5. Persist conversation (skipped for persist=False one-shot turns)
     """
-    if not session_id:
-        session_id = str(uuid.uuid4())
-
-    # Ensure session exists then load history
-    ensure_session(tenant_id, session_id)
-    history_messages = load_session(tenant_id, session_id) if include_history else []
-
-    embeddings = get_embedding_service()
-    vector_store = get_vector_store()
-
-    # Retrieval
-    query_emb = embeddings.embed_query(user_message)
-    # Use a wider recall for search then trim context; apply configured score threshold
-    search_top_k = settings.max_search_k if settings.max_search_k and settings.max_search_k > top_k else top_k
-    results = vector_store.search(
-        tenant_id=tenant_id,
-        embedding=query_emb,
-        top_k=search_top_k,
-        score_threshold=settings.min_score_threshold,
-        source_ids=source_ids
+    session_id, results, citations, sources, llm_messages = _prepare_turn(
+        tenant_id, user_message, session_id, top_k, include_history, source_ids, persist
     )
 
-    context_str, citations, sources = build_context_chunks(results)
-
-    # Retrieval safety checks
     if not results:
         answer = "No relevant context found for this query."
-        # Persist user + assistant minimal
-        history_messages.append({"role": "user", "content": user_message})
-        history_messages.append({"role": "assistant", "content": answer})
-        append_messages(tenant_id, session_id, [{"role": "user", "content": user_message},
-                                                {"role": "assistant", "content": answer}])
+        _persist_turn(tenant_id, session_id, user_message, answer)
         return {
             "session_id": session_id,
             "answer": answer,
@@ -133,53 +319,51 @@ def rag_chat(
             "sources": []
         }
 
-    # If a min_score_threshold is configured, ensure top hit meets it
-    top_score = results[0].score if results else None
-    # if settings.min_score_threshold is not None and (top_score is None or top_score < settings.min_score_threshold):
-    #     answer = "No relevant context found for this query."
-    #     history_messages.append({"role": "user", "content": user_message})
-    #     history_messages.append({"role": "assistant", "content": answer})
-    #     append_messages(tenant_id, session_id, [{"role": "user", "content": user_message},
-    #                                             {"role": "assistant", "content": answer}])
-    #     return {
-    #         "session_id": session_id,
-    #         "answer": answer,
-    #         "citations": [],
-    #         "used_chunks": 0,
-    #         "sources": []
-    #     }
-
-    # For short queries, ensure the retrieved chunks actually contain the query keyword to avoid noisy hits
-    # if settings.require_keyword_in_short_queries:
-    #     tokens = [t.lower() for t in user_message.split() if t.strip()]
-    #     if len(tokens) <= settings.short_query_token_threshold:
-    #         found = False
-    #         for r in results:
-    #             text_lower = (r.text or "").lower()
-    #             if any(tok in text_lower for tok in tokens):
-    #                 found = True
-    #                 break
-    #         if not found:
-    #             answer = "No relevant context found for this query."
-    #             history_messages.append({"role": "user", "content": user_message})
-    #             history_messages.append({"role": "assistant", "content": answer})
-    #             append_messages(tenant_id, session_id, [{"role": "user", "content": user_message},
-    #                                                     {"role": "assistant", "content": answer}])
-    #             return {
-    #                 "session_id": session_id,
-    #                 "answer": answer,
-    #                 "citations": [],
-    #                 "used_chunks": 0,
-    #                 "sources": []
-    #             }
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("llm_messages=%s", llm_messages)
+    # Call model
+    try:
+        answer = chat_complete(llm_messages)
+    except Exception as e:
+        answer = f"LLM backend error: {e}"
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("llm_answer=%s", answer)
+    answer = _normalize_answer(answer)
+
+    _persist_turn(tenant_id, session_id, user_message, answer)
+
+    return {
+        "session_id": session_id,
+        "answer": answer,
+        "citations": citations,
+        "used_chunks": len(citations),
+        "sources": sources
+    }
+
+
+async def arag_chat(
+    tenant_id: str,
+    user_message: str,
+    session_id: str | None,
+    top_k: int,
+    include_history: bool,
+    source_ids: List[str] | None = None,
+    persist: bool = True
+) -> Dict[str, Any]:
+    """
+    Async variant of rag_chat for use from the FastAPI event loop: the
+    blocking retrieval/persistence halves run in worker threads and the LLM
+    call awaits an async client, so a single worker can serve many
+    concurrent chats.
+    """
+    session_id, results, citations, sources, llm_messages = await asyncio.to_thread(
+        _prepare_turn, tenant_id, user_message, session_id, top_k, include_history, source_ids, persist
+    )
 
     if not results:
         answer = "No relevant context found for this query."
-        # Persist user + assistant minimal
-        history_messages.append({"role": "user", "content": user_message})
-        history_messages.append({"role": "assistant", "content": answer})
-        append_messages(tenant_id, session_id, [{"role": "user", "content": user_message},
-                                                {"role": "assistant", "content": answer}])
+        await asyncio.to_thread(_persist_turn, tenant_id, session_id, user_message, answer)
         return {
             "session_id": session_id,
             "answer": answer,
@@ -187,52 +371,58 @@ def rag_chat(
             "used_chunks": 0,
             "sources": []
         }
-    #print("Context:", context_str)
-
-    system_prompt = SYSTEM_TEMPLATE.format(context=context_str)
-    # Build message list for LLM
-    llm_messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
-
-    # Append prior conversation (truncate if very long)
-    token_budget_est = 0
-    for m in history_messages[-20:]:
-        token_budget_est += len(m["content"])
-        if token_budget_est > 12000:
-            break
-        llm_messages.append({"role": m["role"], "content": m["content"]})
-
-    # Current user turn
-    llm_messages.append({"role": "user", "content": user_message})
 
-    print("LLM message", llm_messages)
-    # Call model
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("llm_messages=%s", llm_messages)
     try:
-        answer = chat_complete(llm_messages)
+        answer = await achat_complete(llm_messages)
     except Exception as e:
         answer = f"LLM backend error: {e}"
 
-    print("LLM answer:", answer)
-    # Normalise unknown/empty model replies to the exact phrase required by the system prompt.
-    # This ensures callers get the deterministic response when the model cannot answer
-    # from the provided documents.
-    canonical_unknown = "I don't know based on the provided documents."
-    if isinstance(answer, str):
-        ans_str = answer.strip()
-        low = ans_str.lower()
-        # If answer is empty or contains a variant of "i don't know", replace with canonical phrase.
-        if not ans_str or "i don't know" in low:
-            answer = canonical_unknown
-
-    # Persist
-    history_messages.append({"role": "user", "content": user_message})
-    history_messages.append({"role": "assistant", "content": answer})
-    append_messages(tenant_id, session_id, [{"role": "user", "content": user_message},
-                                            {"role": "assistant", "content": answer}])
+    answer = _normalize_answer(answer)
+    await asyncio.to_thread(_persist_turn, tenant_id, session_id, user_message, answer)
 
     return {
         "session_id": session_id,
         "answer": answer,
         "citations": citations,
         "used_chunks": len(citations),
-        "sources": list(dict.fromkeys(sources))
+        "sources": sources
     }
+
+
+def rag_chat_stream(
+    tenant_id: str,
+    user_message: str,
+    session_id: str | None,
+    top_k: int,
+    include_history: bool,
+    source_ids: List[str] | None = None,
+    persist: bool = True
+) -> Iterator[str]:
+    """
+    Streaming variant of rag_chat: yields assistant text deltas as they arrive
+    and persists the concatenated answer once the stream completes.
+    """
+    session_id, results, citations, sources, llm_messages = _prepare_turn(
+        tenant_id, user_message, session_id, top_k, include_history, source_ids, persist
+    )
+
+    if not results:
+        answer = "No relevant context found for this query."
+        yield answer
+        _persist_turn(tenant_id, session_id, user_message, answer)
+        return
+
+    parts: List[str] = []
+    try:
+        for delta in chat_stream(llm_messages):
+            parts.append(delta)
+            yield delta
+    except Exception as e:
+        err = f"LLM backend error: {e}"
+        parts.append(err)
+        yield err
+
+    answer = _normalize_answer("".join(parts))
+    _persist_turn(tenant_id, session_id, user_message, answer)
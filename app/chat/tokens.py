@@ -0,0 +1,36 @@
+from __future__ import annotations
+"""
+Token counting helpers for prompt budgeting.
+
+Uses tiktoken (cl100k_base) when available; otherwise falls back to a
+chars/4 heuristic so the budget check still works without the optional
+dependency.
+"""
+from functools import lru_cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover
+    tiktoken = None  # type: ignore
+
+
+@lru_cache(maxsize=1)
+def _encoder():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:  # pragma: no cover - e.g. offline first run
+        logger.warning("tiktoken encoding unavailable (%s); using char heuristic", e)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text; approximate (len/4) when tiktoken is unavailable."""
+    enc = _encoder()
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text))
@@ -31,9 +31,17 @@ class Settings(BaseSettings):
     qdrant_url: str = Field(default="http://localhost:6333")
     qdrant_api_key: str | None = Field(default=None)  # if you later secure Qdrant
     qdrant_collection: str = Field(default="documents")
+    qdrant_prefer_grpc: bool = True  # protobuf transport; falls back to REST if 6334 unreachable
+    qdrant_grpc_port: int = 6334
+    qdrant_pool_size: int = 32  # HTTP connections shared by concurrent requests
+    qdrant_timeout: int = 60    # seconds; bulk upserts can exceed the client default
+    quantization: str = Field(default="none")  # none | scalar | binary
+    quantization_oversampling: float = 2.0  # candidate expansion factor when rescoring quantized hits
 
     # Ingestion / retrieval
     embedding_batch_size: int = 64
+    embed_max_workers: int = 8   # concurrent embedding requests per batch
+    embedding_cache_max_entries: int = 100_000  # LRU bound on the in-memory embedding cache
     chunk_size: int = 800
     chunk_overlap: int = 80
     max_search_k: int = 50       # initial vector recall set
@@ -49,6 +57,13 @@ class Settings(BaseSettings):
     enable_streaming: bool = False
     max_context_docs: int = 8
 
+    max_history_tokens: int = 3000  # token budget for prior turns included in the prompt
+    max_context_chars: int = 24000  # hard cap on total prompt chars before calling the LLM
+
+    # Retrieval query cache (in-process LRU+TTL)
+    query_cache_max_size: int = 512
+    query_cache_ttl_seconds: float = 300.0
+
     # Storage
     storage_root: str = "storage"
 
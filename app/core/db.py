@@ -1,6 +1,7 @@
 from __future__ import annotations
 import psycopg
 from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
 from contextlib import contextmanager
 from typing import Iterator, Any
 import logging
@@ -11,7 +12,7 @@ import time
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-_POOL: psycopg.Connection | None = None
+_POOL: ConnectionPool | None = None
 
 DDL = """
 CREATE TABLE IF NOT EXISTS tenants (
@@ -59,16 +60,39 @@ CREATE TABLE IF NOT EXISTS chat_messages (
     FOREIGN KEY (tenant_id, session_id) REFERENCES chat_sessions(tenant_id, session_id) ON DELETE CASCADE
 );
 
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    tenant_id TEXT NOT NULL,
+    job_id UUID NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued','running','done','failed')),
+    detail TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (tenant_id, job_id),
+    FOREIGN KEY (tenant_id) REFERENCES tenants(tenant_id) ON DELETE CASCADE
+);
+
 CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages(tenant_id, session_id, turn_index);
+
+-- Dropped: a covering index with INCLUDE (content) breaks on long messages
+-- (btree index tuples cap at ~2.7KB); the primary key already serves the
+-- last-N-turns scan via a backward index scan.
+DROP INDEX IF EXISTS idx_chat_messages_session_cover;
 """
 
 def _dsn() -> str:
-    return (
-        f"host={settings.pg_host} "
-        f"port={settings.pg_port} "
-        f"dbname={settings.pg_db} "
-        f"user={settings.pg_user} "
-        f"password={settings.pg_password}"
+    # make_conninfo handles quoting/escaping of values; aggressive TCP
+    # keepalives keep pooled connections alive across NAT idle timers.
+    return psycopg.conninfo.make_conninfo(
+        host=settings.pg_host,
+        port=settings.pg_port,
+        dbname=settings.pg_db,
+        user=settings.pg_user,
+        password=settings.pg_password,
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=3,
+        application_name="multi-tenant-rag",
     )
 
 def init_pool(retries: int = 20, delay: float = 1.0) -> None:
@@ -78,8 +102,17 @@ def init_pool(retries: int = 20, delay: float = 1.0) -> None:
     last_err: Exception | None = None
     for attempt in range(1, retries + 1):
         try:
-            _POOL = psycopg.connect(_dsn(), autocommit=True)
-            logger.info("Postgres connection established.")
+            pool = ConnectionPool(
+                conninfo=_dsn(),
+                min_size=settings.pg_minconn,
+                max_size=settings.pg_maxconn,
+                kwargs={"autocommit": True},
+                open=True,
+            )
+            pool.wait(timeout=30)
+            _POOL = pool
+            logger.info("Postgres connection pool ready (min=%d max=%d).",
+                        settings.pg_minconn, settings.pg_maxconn)
             return
         except Exception as e:  # noqa
             last_err = e
@@ -87,10 +120,20 @@ def init_pool(retries: int = 20, delay: float = 1.0) -> None:
             time.sleep(delay)
     raise RuntimeError(f"Failed to connect to Postgres after {retries} attempts: {last_err}")
 
+# Arbitrary app-wide key for the migration advisory lock.
+_MIGRATION_LOCK_KEY = 727_001
+
 def run_migrations() -> None:
     assert _POOL is not None, "Pool not initialized"
-    with _POOL.cursor() as cur:
-        cur.execute(DDL)
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            # Serialize DDL across uvicorn workers: one worker runs it, the
+            # rest block briefly on the lock and find everything in place.
+            cur.execute("SELECT pg_advisory_lock(%s)", (_MIGRATION_LOCK_KEY,))
+            try:
+                cur.execute(DDL)
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (_MIGRATION_LOCK_KEY,))
     logger.info("Database migrations ensured.")
 
 @contextmanager
@@ -98,7 +141,21 @@ def get_conn() -> Iterator[psycopg.Connection]:
     if _POOL is None:
         init_pool()
     assert _POOL is not None
-    yield _POOL
+    with _POOL.connection() as conn:
+        yield conn
+
+def close_pool() -> None:
+    global _POOL
+    if _POOL is not None:
+        _POOL.close()
+        _POOL = None
+        logger.info("Postgres connection pool closed.")
+
+def pool_stats() -> dict:
+    """Pool utilisation counters for the /metrics endpoint."""
+    if _POOL is None:
+        return {}
+    return _POOL.get_stats()
 
 def fetch_all(query: str, *params: Any) -> list[dict]:
     with get_conn() as conn:
@@ -112,11 +169,47 @@ def fetch_one(query: str, *params: Any) -> dict | None:
             cur.execute(query, params)
             return cur.fetchone()
 
+def fetch_iter(query: str, *params: Any, batch_size: int = 500) -> Iterator[dict]:
+    """
+    Yield rows from a server-side cursor, fetching `batch_size` at a time.
+
+    Unlike fetch_all this never materializes the full result set, so large
+    listings can stream to the client in constant memory. The connection is
+    held (and the generator must be exhausted or closed) for the duration.
+    """
+    with get_conn() as conn:
+        # Named cursors need a transaction; the pool hands out autocommit
+        # connections, so open one explicitly for the scan.
+        with conn.transaction():
+            with conn.cursor(name="fetch_iter", row_factory=dict_row) as cur:
+                cur.itersize = batch_size
+                cur.execute(query, params)
+                yield from cur
+
 def execute(query: str, *params: Any) -> None:
     with get_conn() as conn:
         with conn.cursor() as cur:
             cur.execute(query, params)
 
+def run_pipeline(statements: list[tuple[str, tuple[Any, ...]]]) -> list[list[dict] | None]:
+    """
+    Execute several statements in one network flush using psycopg pipeline mode.
+
+    Returns one entry per statement: the fetched rows (dicts) for statements
+    producing a result set, None otherwise.
+    """
+    with get_conn() as conn:
+        cursors = []
+        with conn.pipeline():
+            for query, params in statements:
+                cur = conn.cursor(row_factory=dict_row)
+                cur.execute(query, params)
+                cursors.append(cur)
+        results: list[list[dict] | None] = []
+        for cur in cursors:
+            results.append(list(cur.fetchall()) if cur.description is not None else None)
+        return results
+
 def execute_returning(query: str, *params: Any) -> Any:
     with get_conn() as conn:
         with conn.cursor() as cur:
@@ -1,9 +1,9 @@
 from __future__ import annotations
 import uuid
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterator, List, Optional
 from app.core.config import get_settings
-from app.core.db import fetch_one, fetch_all, execute
+from app.core.db import fetch_one, fetch_all, fetch_iter, execute
 
 _settings = get_settings()
 
@@ -36,20 +36,17 @@ def create_source(tenant_id: str, source_name: str) -> str:
         raise ValueError("source_name is required")
     
     source_name = source_name.strip()
-    
-    # Check if source already exists
-    existing = fetch_one(
-        "SELECT source_id FROM sources WHERE tenant_id=%s AND source_name=%s",
-        tenant_id, source_name
-    )
-    if existing:
-        raise ValueError(f"Source '{source_name}' already exists for this tenant")
-    
+
+    # Single round-trip: the UNIQUE (tenant_id, source_name) constraint does
+    # the existence check; no row returned means it already existed.
     source_id = str(uuid.uuid4())
-    execute(
-        "INSERT INTO sources (tenant_id, source_id, source_name) VALUES (%s, %s, %s)",
+    row = fetch_one(
+        "INSERT INTO sources (tenant_id, source_id, source_name) VALUES (%s, %s, %s) "
+        "ON CONFLICT (tenant_id, source_name) DO NOTHING RETURNING source_id",
         tenant_id, source_id, source_name
     )
+    if row is None:
+        raise ValueError(f"Source '{source_name}' already exists for this tenant")
     return source_id
 
 def list_sources(tenant_id: str) -> List[Source]:
@@ -69,6 +66,21 @@ def list_sources(tenant_id: str) -> List[Source]:
         for r in rows
     ]
 
+def iter_sources(tenant_id: str) -> Iterator[dict]:
+    """
+    Stream sources for a tenant one row at a time (server-side cursor).
+    Used by the ndjson list endpoint so huge tenants don't buffer in memory.
+    """
+    for r in fetch_iter(
+        "SELECT source_id, source_name, created_at FROM sources WHERE tenant_id=%s ORDER BY created_at DESC",
+        tenant_id
+    ):
+        yield {
+            "source_id": str(r["source_id"]),
+            "source_name": r["source_name"],
+            "created_at": str(r["created_at"]),
+        }
+
 def get_source(tenant_id: str, source_id: str) -> Optional[Source]:
     """
     Get a specific source by ID.
@@ -105,18 +117,14 @@ def delete_source(tenant_id: str, source_id: str) -> bool:
     """
     Delete a source and all its documents. Returns True if deleted, False if not found.
     """
+    # DELETE ... RETURNING merges the existence check into the delete: one
+    # round-trip, no TOCTOU window. The documents cascade is already covered
+    # by that table's (tenant_id, source_id, document_id) primary key.
     row = fetch_one(
-        "SELECT source_id FROM sources WHERE tenant_id=%s AND source_id=%s",
-        tenant_id, source_id
-    )
-    if not row:
-        return False
-    
-    execute(
-        "DELETE FROM sources WHERE tenant_id=%s AND source_id=%s",
+        "DELETE FROM sources WHERE tenant_id=%s AND source_id=%s RETURNING source_id",
         tenant_id, source_id
     )
-    return True
+    return row is not None
 
 def get_source_context(tenant_id: str, source_id: str) -> SourceContext:
     """
@@ -168,6 +176,21 @@ def list_documents(tenant_id: str, source_id: str) -> List[Document]:
         for r in rows
     ]
 
+def iter_documents(tenant_id: str, source_id: str) -> Iterator[dict]:
+    """
+    Stream documents in a source one row at a time (server-side cursor).
+    """
+    for r in fetch_iter(
+        "SELECT document_id, filename, file_path, uploaded_at FROM documents WHERE tenant_id=%s AND source_id=%s ORDER BY uploaded_at DESC",
+        tenant_id, source_id
+    ):
+        yield {
+            "document_id": str(r["document_id"]),
+            "filename": r["filename"],
+            "file_path": r["file_path"],
+            "uploaded_at": str(r["uploaded_at"]),
+        }
+
 def count_documents(tenant_id: str, source_id: str) -> int:
     """
     Count documents in a source.
@@ -1,7 +1,10 @@
 from __future__ import annotations
 import re
+import threading
+import time
 import uuid
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Set
 from app.core.config import get_settings
 from app.core.db import fetch_one, fetch_all, execute
@@ -9,16 +12,27 @@ from app.core.db import fetch_one, fetch_all, execute
 _settings = get_settings()
 _TENANT_ID_RE = re.compile(_settings.tenant_id_pattern)
 
+# Tenant existence rarely changes; remember positive lookups briefly so
+# steady-state request validation skips the Postgres round trip.
+_TENANT_EXISTS_TTL = 30.0
+_tenant_exists_cache: dict[str, float] = {}
+_tenant_exists_lock = threading.Lock()
+
 @dataclass(frozen=True)
 class TenantContext:
     tenant_id: str
 
 # ------------- Validation -------------
 
+@lru_cache(maxsize=4096)
+def _tenant_id_valid(tenant_id: str) -> bool:
+    # The same tenant ids repeat on every request; cache the regex verdict.
+    return bool(_TENANT_ID_RE.match(tenant_id))
+
 def validate_tenant_id(tenant_id: str) -> None:
     if not tenant_id:
         raise ValueError("tenant_id required")
-    if not _TENANT_ID_RE.match(tenant_id):
+    if not _tenant_id_valid(tenant_id):
         raise ValueError("Invalid tenant_id pattern")
 
 # ------------- Persistence (Postgres) -------------
@@ -28,18 +42,24 @@ def register_tenant(tenant_id: str) -> None:
     Insert tenant row if it does not exist (idempotent).
     """
     validate_tenant_id(tenant_id)
-    row = fetch_one("SELECT tenant_id FROM tenants WHERE tenant_id=%s", tenant_id)
-    if row:
-        return
-    execute("INSERT INTO tenants (tenant_id) VALUES (%s)", tenant_id)
+    execute("INSERT INTO tenants (tenant_id) VALUES (%s) ON CONFLICT DO NOTHING", tenant_id)
+    with _tenant_exists_lock:
+        _tenant_exists_cache.pop(tenant_id, None)
 
 def list_tenants() -> Set[str]:
     rows = fetch_all("SELECT tenant_id FROM tenants ORDER BY tenant_id")
     return {r["tenant_id"] for r in rows}
 
 def ensure_tenant_exists(tenant_id: str) -> None:
+    now = time.monotonic()
+    with _tenant_exists_lock:
+        checked_at = _tenant_exists_cache.get(tenant_id)
+        if checked_at is not None and now - checked_at < _TENANT_EXISTS_TTL:
+            return
     if not fetch_one("SELECT tenant_id FROM tenants WHERE tenant_id=%s", tenant_id):
         raise ValueError(f"Unknown tenant_id '{tenant_id}'. Create tenant first.")
+    with _tenant_exists_lock:
+        _tenant_exists_cache[tenant_id] = now
 
 def get_tenant_context(tenant_id: str) -> TenantContext:
     validate_tenant_id(tenant_id)
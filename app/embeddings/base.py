@@ -1,16 +1,18 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from typing import Sequence, List
-import hashlib
 import threading
 import time
+import numpy as np
+import xxhash
 
 class EmbeddingsProvider(ABC):
     """Abstract embeddings provider."""
 
     @abstractmethod
-    def embed_texts(self, texts: Sequence[str]) -> List[List[float]]:
-        """Embed multiple documents (batch)."""
+    def embed_texts(self, texts: Sequence[str], digests: Sequence[bytes] | None = None) -> List[List[float]]:
+        """Embed multiple documents (batch); digests are optional precomputed content hashes."""
         raise NotImplementedError
 
     @abstractmethod
@@ -19,41 +21,115 @@ class EmbeddingsProvider(ABC):
         raise NotImplementedError
 
 
+# Shard count for the embedding cache (power of two so we can mask)
+_SHARD_COUNT = 16
+
+
 class InMemoryEmbeddingCache:
     """
-    Simple thread-safe in-memory cache.
+    Thread-safe in-memory LRU cache, sharded by key hash so concurrent
+    search/ingest threads do not serialize on one global lock.
     Key derivation includes model name (provided by caller).
-    Not persistent; promote to Redis / disk later if needed.
+    Bounded (max_entries) so long-running multi-tenant ingestion cannot grow
+    it without limit. Not persistent; promote to Redis / disk later if needed.
     """
 
-    def __init__(self) -> None:
-        self._lock = threading.RLock()
-        self._store: dict[str, List[float]] = {}
+    def __init__(self, max_entries: int | None = None) -> None:
+        if max_entries is None:
+            from app.core.config import get_settings
+            max_entries = get_settings().embedding_cache_max_entries
+        self.max_entries = max_entries
+        self._shard_max = max(1, max_entries // _SHARD_COUNT)
+        # float16 ndarrays: ~14x smaller than a Python list of boxed floats
+        # and half of float32, so twice the embeddings stay resident. The
+        # rounding (~1e-3 relative) is far below what int8 server-side
+        # quantization already tolerates; entries are widened on the way out.
+        self._shards: list[tuple[threading.RLock, OrderedDict[bytes, np.ndarray]]] = [
+            (threading.RLock(), OrderedDict()) for _ in range(_SHARD_COUNT)
+        ]
 
     @staticmethod
-    def _hash_key(model: str, text: str) -> str:
-        h = hashlib.sha256()
+    def _hash_key(model: str, text: str) -> bytes:
+        # xxh3 is ~an order of magnitude faster than SHA-256 per byte and a
+        # 16-byte digest is plenty for an in-process cache key; content
+        # addressing that leaves the process (doc IDs) stays on SHA-256.
+        h = xxhash.xxh3_128()
         h.update(model.encode("utf-8"))
         h.update(b"\x00")
         h.update(text.encode("utf-8"))
-        return h.hexdigest()
+        return h.digest()
+
+    @staticmethod
+    def _key_from_digest(model: str, digest: bytes) -> bytes:
+        # Callers that already content-hashed the text (ingestion dedup) pass
+        # the digest so only a few dozen bytes get rehashed here, not the text.
+        h = xxhash.xxh3_128()
+        h.update(model.encode("utf-8"))
+        h.update(b"\x00")
+        h.update(digest)
+        return h.digest()
+
+    def _keys(self, model: str, texts: Sequence[str], digests: Sequence[bytes] | None) -> list[bytes]:
+        if digests is not None:
+            return [self._key_from_digest(model, d) for d in digests]
+        return [self._hash_key(model, t) for t in texts]
+
+    @staticmethod
+    def _shard_index(key: bytes) -> int:
+        return key[0] & (_SHARD_COUNT - 1)
 
-    def get(self, model: str, text: str) -> List[float] | None:
+    def get(self, model: str, text: str) -> np.ndarray | None:
         k = self._hash_key(model, text)
-        with self._lock:
-            return self._store.get(k)
+        lock, store = self._shards[self._shard_index(k)]
+        with lock:
+            emb = store.get(k)
+            if emb is not None:
+                store.move_to_end(k)
+        return emb.astype(np.float32) if emb is not None else None
 
-    def put(self, model: str, text: str, embedding: List[float]) -> None:
+    def put(self, model: str, text: str, embedding: Sequence[float]) -> None:
         k = self._hash_key(model, text)
-        with self._lock:
-            self._store[k] = embedding
+        arr = np.asarray(embedding, dtype=np.float16)
+        lock, store = self._shards[self._shard_index(k)]
+        with lock:
+            store[k] = arr
+            store.move_to_end(k)
+            while len(store) > self._shard_max:
+                store.popitem(last=False)
 
-    def batch_get(self, model: str, texts: Sequence[str]) -> list[List[float] | None]:
-        return [self.get(model, t) for t in texts]
+    def batch_get(self, model: str, texts: Sequence[str],
+                  digests: Sequence[bytes] | None = None) -> list[np.ndarray | None]:
+        # Group keys by shard and take each shard lock once for the batch
+        keys = self._keys(model, texts, digests)
+        out: list[np.ndarray | None] = [None] * len(texts)
+        by_shard: dict[int, list[int]] = {}
+        for i, k in enumerate(keys):
+            by_shard.setdefault(self._shard_index(k), []).append(i)
+        for shard_idx, positions in by_shard.items():
+            lock, store = self._shards[shard_idx]
+            with lock:
+                for i in positions:
+                    emb = store.get(keys[i])
+                    if emb is not None:
+                        store.move_to_end(keys[i])
+                        out[i] = emb.astype(np.float32)
+        return out
 
-    def batch_put(self, model: str, texts: Sequence[str], embeddings: Sequence[List[float]]) -> None:
-        for t, e in zip(texts, embeddings):
-            self.put(model, t, e)
+    def batch_put(self, model: str, texts: Sequence[str], embeddings: Sequence[Sequence[float]],
+                  digests: Sequence[bytes] | None = None) -> None:
+        keys = self._keys(model, texts, digests)
+        arrays = [np.asarray(e, dtype=np.float16) for e in embeddings]
+        by_shard: dict[int, list[int]] = {}
+        for i, k in enumerate(keys):
+            by_shard.setdefault(self._shard_index(k), []).append(i)
+        for shard_idx, positions in by_shard.items():
+            lock, store = self._shards[shard_idx]
+            with lock:
+                for i in positions:
+                    store[keys[i]] = arrays[i]
+                    store.move_to_end(keys[i])
+                while len(store) > self._shard_max:
+                    store.popitem(last=False)
 
 
 def retry_with_backoff(fn, *, max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 8.0):
@@ -14,16 +14,19 @@ Environment fields (Settings):
 
 Add more providers (google, anthropic, databricks) by extending _build_provider.
 """
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Sequence, Protocol
+import numpy as np
 from openai import OpenAI  # only used if provider=openai (ensure package installed)
 from app.core.config import get_settings
+from app.embeddings.base import InMemoryEmbeddingCache
 from app.embeddings.ollama_local import get_embeddings_provider as get_ollama_embeddings
 import logging
 
 logger = logging.getLogger(__name__)
 
 class EmbeddingsLike(Protocol):
-    def embed_texts(self, texts: Sequence[str]) -> List[List[float]]: ...
+    def embed_texts(self, texts: Sequence[str], digests: Sequence[bytes] | None = None) -> List[List[float]]: ...
     def embed_query(self, text: str) -> List[float]: ...
 
 _singletons: dict[str, EmbeddingsLike] = {}
@@ -41,18 +44,53 @@ def _build_provider(settings) -> EmbeddingsLike:
         client = OpenAI(api_key=settings.openai_api_key)
 
         class OpenAIEmbeddingsAdapter:
+            # Same content-hash cache the Ollama provider uses, so re-uploaded
+            # documents with high overlap skip the paid API call per chunk.
+            _cache = InMemoryEmbeddingCache()
+            # Inputs per API request; large upload batches fan out across a
+            # few concurrent requests instead of one giant serialized call.
+            _BATCH_WINDOW = 64
+            _MAX_PARALLEL = 4
+
             def __init__(self, model: str):
                 self.model = model
-            def embed_texts(self, texts: Sequence[str]) -> List[List[float]]:
-                if not texts:
-                    return []
-                # OpenAI embeddings API
-                resp = client.embeddings.create(model=self.model, input=list(texts))
+            def _embed_window(self, window: List[str]) -> List[List[float]]:
                 # new client returns .data list with .embedding
+                resp = client.embeddings.create(model=self.model, input=window)
                 return [d.embedding for d in resp.data]
+            def embed_texts(self, texts: Sequence[str], digests: Sequence[bytes] | None = None) -> List[List[float]]:
+                if not texts:
+                    return []
+                cached = self._cache.batch_get(self.model, texts, digests=digests)
+                miss_idx = [i for i, c in enumerate(cached) if c is None]
+                if miss_idx:
+                    miss_texts = [texts[i] for i in miss_idx]
+                    windows = [miss_texts[i:i + self._BATCH_WINDOW]
+                               for i in range(0, len(miss_texts), self._BATCH_WINDOW)]
+                    if len(windows) == 1:
+                        computed = self._embed_window(windows[0])
+                    else:
+                        computed = []
+                        with ThreadPoolExecutor(max_workers=self._MAX_PARALLEL) as ex:
+                            for res in ex.map(self._embed_window, windows):
+                                computed.extend(res)
+                    for i, emb in zip(miss_idx, computed):
+                        cached[i] = np.asarray(emb, dtype=np.float32)
+                    self._cache.batch_put(
+                        self.model,
+                        [texts[i] for i in miss_idx],
+                        [cached[i] for i in miss_idx],
+                        digests=[digests[i] for i in miss_idx] if digests is not None else None,
+                    )
+                return cached  # type: ignore[return-value]
             def embed_query(self, text: str) -> List[float]:
+                cached = self._cache.get(self.model, text)
+                if cached is not None:
+                    return cached
                 resp = client.embeddings.create(model=self.model, input=[text])
-                return resp.data[0].embedding
+                emb = np.asarray(resp.data[0].embedding, dtype=np.float32)
+                self._cache.put(self.model, text, emb)
+                return emb
 
         return OpenAIEmbeddingsAdapter(model)
 
@@ -1,7 +1,11 @@
 from __future__ import annotations
 from typing import Sequence, List
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import threading
 import httpx
 import logging
+import numpy as np
 from .base import EmbeddingsProvider, InMemoryEmbeddingCache, retry_with_backoff
 from app.core.config import get_settings
 
@@ -11,33 +15,53 @@ _settings = get_settings()
 _cache = InMemoryEmbeddingCache()
 
 class OllamaLocalEmbeddings(EmbeddingsProvider):
-    def __init__(self, base_url: str | None = None, model: str | None = None, timeout: float = 60.0):
+    # Inputs per /api/embed call; keeps request payloads and server-side
+    # batches a sane size without giving up the single-round-trip win.
+    _BATCH_WINDOW = 64
+
+    def __init__(self, base_url: str | None = None, model: str | None = None,
+                 timeout: float = 60.0, max_workers: int | None = None):
         self.base_url = (base_url or _settings.ollama_base_url).rstrip("/")
         self.model = model or _settings.embed_model
         self.timeout = timeout
+        self.max_workers = max_workers or _settings.embed_max_workers
+        self._client: httpx.Client | None = None
+        self._client_lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self._batch_supported: bool | None = None
 
     # ------------- Public API -------------
 
-    def embed_texts(self, texts: Sequence[str]) -> List[List[float]]:
+    def embed_texts(self, texts: Sequence[str], digests: Sequence[bytes] | None = None) -> List[np.ndarray]:
+        """
+        Embed a batch of documents. Callers that already content-hashed the
+        texts (ingestion) pass `digests` so the cache does not rehash them.
+        """
         if not texts:
             return []
         # cache lookup
-        cached = _cache.batch_get(self.model, texts)
+        cached = _cache.batch_get(self.model, texts, digests=digests)
         to_compute_idx: list[int] = [i for i, c in enumerate(cached) if c is None]
         if to_compute_idx:
             to_compute_texts = [texts[i] for i in to_compute_idx]
             computed = self._batch_embed(to_compute_texts)
             for i, emb in zip(to_compute_idx, computed):
-                cached[i] = emb
-                _cache.put(self.model, texts[i], emb)
+                cached[i] = np.asarray(emb, dtype=np.float32)
+            # One sharded batch insert instead of a lock acquisition per chunk
+            _cache.batch_put(
+                self.model,
+                to_compute_texts,
+                [cached[i] for i in to_compute_idx],
+                digests=[digests[i] for i in to_compute_idx] if digests is not None else None,
+            )
         # type ignore guarded by filling above
         return [c for c in cached if c is not None]  # type: ignore
 
-    def embed_query(self, text: str) -> List[float]:
+    def embed_query(self, text: str) -> np.ndarray:
         cached = _cache.get(self.model, text)
         if cached is not None:
             return cached
-        emb = self._single_embed(text)
+        emb = np.asarray(self._single_embed(text), dtype=np.float32)
         _cache.put(self.model, text, emb)
         return emb
 
@@ -49,27 +73,106 @@ class OllamaLocalEmbeddings(EmbeddingsProvider):
         return retry_with_backoff(_call)
 
     def _batch_embed(self, texts: Sequence[str]) -> List[List[float]]:
-        # Ollama embeddings API currently processes one prompt per call.
-        # For now loop sequentially; could parallelize with threads if needed.
-        out: List[List[float]] = []
-        for t in texts:
-            out.append(self._single_embed(t))
-        return out
+        texts = list(texts)
+        if len(texts) <= 1:
+            return [self._single_embed(t) for t in texts]
+        # Ollama >= 0.1.39 accepts a list of inputs on /api/embed: one HTTP
+        # round trip per window instead of one per chunk.
+        if self._supports_batch():
+            windows = [texts[i:i + self._BATCH_WINDOW]
+                       for i in range(0, len(texts), self._BATCH_WINDOW)]
+            if len(windows) == 1:
+                return retry_with_backoff(lambda: self._request_embeddings_batch(windows[0]))
+            # Multiple windows are independent HTTP calls; run them on the
+            # embed pool so the server can pipeline batches.
+            out: List[List[float]] = []
+            for res in self._get_executor().map(
+                lambda w: retry_with_backoff(lambda: self._request_embeddings_batch(w)), windows
+            ):
+                out.extend(res)
+            return out
+        # Older servers: one prompt per call; the calls are independent and
+        # network-bound, so fan them out across threads.
+        return list(self._get_executor().map(self._single_embed, texts))
+
+    def _supports_batch(self) -> bool:
+        # Probe /api/embed once per provider; older Ollama builds 404 it.
+        if self._batch_supported is None:
+            try:
+                r = self._get_client().post(
+                    f"{self.base_url}/api/embed",
+                    json={"model": self.model, "input": []},
+                )
+                self._batch_supported = r.status_code != 404
+            except Exception as e:  # noqa
+                logger.warning("Ollama /api/embed probe failed: %s", e)
+                self._batch_supported = False
+            if not self._batch_supported:
+                logger.info("Ollama /api/embed unavailable; using per-prompt /api/embeddings")
+        return self._batch_supported
+
+    def _get_client(self) -> httpx.Client:
+        # Persistent keep-alive client: avoids a TCP handshake per chunk.
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        timeout=self.timeout,
+                        limits=httpx.Limits(
+                            max_keepalive_connections=self.max_workers,
+                            max_connections=self.max_workers,
+                        ),
+                    )
+                    atexit.register(self.close)
+        return self._client
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._client_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="ollama-embed"
+                    )
+        return self._executor
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _request_embeddings_batch(self, texts: Sequence[str]) -> List[List[float]]:
+        url = f"{self.base_url}/api/embed"
+        payload = {"model": self.model, "input": list(texts)}
+        try:
+            r = self._get_client().post(url, json=payload)
+            r.raise_for_status()
+            data = r.json()
+            embs = data.get("embeddings")
+            if not isinstance(embs, list) or len(embs) != len(texts):
+                raise RuntimeError(
+                    f"Unexpected Ollama /api/embed response: keys={list(data.keys())}"
+                )
+            return embs
+        except Exception as e:  # noqa
+            logger.error("Ollama batch embedding request failed: %s", e)
+            raise
 
     def _request_embedding(self, text: str) -> List[float]:
         url = f"{self.base_url}/api/embeddings"
         payload = {"model": self.model, "prompt": text}
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                r = client.post(url, json=payload)
-                r.raise_for_status()
-                data = r.json()
-                if "embedding" not in data:
-                    raise RuntimeError(f"Unexpected Ollama response keys: {list(data.keys())}")
-                emb = data["embedding"]
-                if not isinstance(emb, list):
-                    raise RuntimeError("Ollama embedding not a list")
-                return emb
+            r = self._get_client().post(url, json=payload)
+            r.raise_for_status()
+            data = r.json()
+            if "embedding" not in data:
+                raise RuntimeError(f"Unexpected Ollama response keys: {list(data.keys())}")
+            emb = data["embedding"]
+            if not isinstance(emb, list):
+                raise RuntimeError("Ollama embedding not a list")
+            return emb
         except Exception as e:  # noqa
             logger.error("Ollama embedding request failed: %s", e)
             raise
@@ -2,17 +2,28 @@ from __future__ import annotations
 import os
 import time
 import hashlib
+import logging
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import List, Iterable, Tuple
 from dataclasses import dataclass
 from pypdf import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+try:
+    # PDFium (C++) extracts text 5-20x faster than pure-Python pypdf and
+    # releases the GIL, so extraction can run in parallel threads.
+    import pypdfium2 as pdfium
+except ImportError:  # pragma: no cover
+    pdfium = None
 from app.core.config import get_settings
 from app.core.tenancy import TenantContext
 from app.vector.base import VectorDocument
 from app.vector.qdrant_store import get_vector_store
 from app.embeddings.factory import get_embedding_service
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
 
 # ---------------- Data Structures ----------------
@@ -29,15 +40,46 @@ class IngestionStats:
 
 # ---------------- Utilities ----------------
 
-def _hash_text(text: str) -> str:
-    h = hashlib.sha256()
-    h.update(text.encode("utf-8"))
-    return h.hexdigest()
+def _hash_text(data: str | bytes) -> str:
+    # Accepts bytes so callers that already encoded the chunk do not pay a
+    # second encode; usedforsecurity=False takes the faster OpenSSL path on
+    # builds that distinguish them (this hash is for dedup, not security).
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data, usedforsecurity=False).hexdigest()
 
 def _normalize_text(text: str) -> str:
     return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
 
 def _load_pdf_texts(file_path: str) -> List[Tuple[int, str]]:
+    if pdfium is not None:
+        return _load_pdf_texts_pdfium(file_path)
+    return _load_pdf_texts_pypdf(file_path)
+
+def _load_pdf_texts_pdfium(file_path: str) -> List[Tuple[int, str]]:
+    pages: List[Tuple[int, str]] = []
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            try:
+                textpage = page.get_textpage()
+                try:
+                    txt = textpage.get_text_range() or ""
+                finally:
+                    textpage.close()
+            except Exception:
+                txt = ""
+            finally:
+                page.close()
+            txt = _normalize_text(txt)
+            if txt:
+                pages.append((i, txt))
+    finally:
+        pdf.close()
+    return pages
+
+def _load_pdf_texts_pypdf(file_path: str) -> List[Tuple[int, str]]:
     reader = PdfReader(file_path)
     pages: List[Tuple[int, str]] = []
     for i, page in enumerate(reader.pages):
@@ -50,27 +92,51 @@ def _load_pdf_texts(file_path: str) -> List[Tuple[int, str]]:
             pages.append((i, txt))
     return pages
 
-def _chunk_page_texts(pages: List[Tuple[int, str]]) -> List[Tuple[int, int, str]]:
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=settings.chunk_size,
-        chunk_overlap=settings.chunk_overlap,
+@lru_cache(maxsize=8)
+def _get_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    # Splitter construction compiles separators; split_text itself is
+    # stateless, so one cached instance is safe to share across threads.
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
         length_function=len,
         is_separator_regex=False,
     )
+
+
+def _chunk_page_texts(pages: List[Tuple[int, str]]) -> List[Tuple[int, int, str]]:
+    splitter = _get_splitter(settings.chunk_size, settings.chunk_overlap)
     out: List[Tuple[int, int, str]] = []
+    min_chunk_chars = getattr(settings, "min_chunk_chars", 0)
     for page_num, page_text in pages:
         # splitter works across docs; give list with single element
         chunks = splitter.split_text(page_text)
         for idx, chunk in enumerate(chunks):
-            norm = _normalize_text(chunk)
-            if not norm:
+            # Page text is already normalized; the splitter only slices it,
+            # so a strip is enough — no second O(len) normalize pass.
+            chunk = chunk.strip()
+            if not chunk:
                 continue
             # Skip very short chunks which are often noise/headers/footers
-            if hasattr(settings, "min_chunk_chars") and settings.min_chunk_chars and len(norm) < settings.min_chunk_chars:
+            if min_chunk_chars and len(chunk) < min_chunk_chars:
                 continue
-            out.append((page_num, idx, norm))
+            out.append((page_num, idx, chunk))
     return out
 
+def _load_and_chunk(pdf_path: str) -> Tuple[int, List[Tuple[str, int, int, str, str]]]:
+    """
+    Parse + chunk + hash one PDF; returns
+    (page_count, [(source, page, chunk_index, text, hash)]).
+
+    Hashing happens here rather than in the consumer so it parallelizes with
+    extraction across the worker threads (hashlib releases the GIL for
+    inputs >= 2 KiB, which typical chunks exceed).
+    """
+    pages = _load_pdf_texts(pdf_path)
+    chunks = [(pdf_path, page_num, chunk_idx, text, _hash_text(text))
+              for page_num, chunk_idx, text in _chunk_page_texts(pages)]
+    return len(pages), chunks
+
 def _iter_pdf_files(root_dir: str) -> Iterable[str]:
     for entry in os.scandir(root_dir):
         if entry.is_file() and entry.name.lower().endswith(".pdf"):
@@ -78,91 +144,201 @@ def _iter_pdf_files(root_dir: str) -> Iterable[str]:
 
 # ---------------- Main Pipeline ----------------
 
+def _doc_id_from_hash(h: str, page: int, cidx: int) -> str:
+    """
+    Deterministic UUID derived directly from the chunk's SHA-256 (Qdrant
+    requires int or UUID ids). uuid5 would rehash the whole name with SHA-1;
+    the content hash already has all the entropy we need, so just take its
+    first 16 bytes, mix in page/chunk position so identical text at different
+    positions keeps distinct ids, and set the RFC 4122 version/variant bits.
+    """
+    raw = bytearray(bytes.fromhex(h)[:16])
+    mix = ((page & 0xFFFF) << 16) | (cidx & 0xFFFF)
+    for i in range(4):
+        raw[12 + i] ^= (mix >> (8 * (3 - i))) & 0xFF
+    raw[6] = (raw[6] & 0x0F) | 0x50
+    raw[8] = (raw[8] & 0x3F) | 0x80
+    return str(uuid.UUID(bytes=bytes(raw)))
+
+
+def _build_doc(source: str, page: int, cidx: int, text: str, h: str,
+               created_at: int, source_id: str | None) -> VectorDocument:
+    doc_id = _doc_id_from_hash(h, page, cidx)
+    metadata = {
+        "text": text,
+        "source": os.path.basename(source),
+        "source_path": source,
+        "page": page,
+        "chunk_index": cidx,
+        "hash": h,
+        "created_at": created_at
+    }
+    if source_id:
+        metadata["source_id"] = source_id
+    return VectorDocument(id=doc_id, text=text, metadata=metadata)
+
+
+class _StreamingUpserter:
+    """
+    Accumulates chunks and flushes dedup -> embed -> upsert in
+    embedding_batch_size windows, so peak memory stays O(batch) instead of
+    O(total chunks). Shared by directory ingest and .txt uploads.
+    """
+
+    def __init__(self, tenant_id: str, source_id: str | None = None):
+        self.tenant_id = tenant_id
+        self.source_id = source_id
+        self.embeddings = get_embedding_service()
+        self.vector_store = get_vector_store()
+        self.batch_size = settings.embedding_batch_size
+        self.created_at = int(time.time())
+        self.raw_chunks = 0
+        self.inserted = 0
+        self._seen: set[bytes] = set()  # raw digests (32B) of chunks already queued
+        self._docs: List[VectorDocument] = []
+        self._digests: List[bytes] = []
+        # Barrier bookkeeping: last point sent fire-and-forget, so finish()
+        # can force a waited write even when the final window is empty.
+        self._unwaited: tuple[VectorDocument, List[float]] | None = None
+
+    def add(self, source: str, page: int, cidx: int, text: str, h: str | None = None) -> None:
+        self.raw_chunks += 1
+        if h is None:
+            h = _hash_text(text)
+        hb = bytes.fromhex(h)
+        if hb in self._seen:
+            return
+        self._seen.add(hb)
+        self._docs.append(_build_doc(source, page, cidx, text, h, self.created_at, self.source_id))
+        self._digests.append(hb)
+        if len(self._docs) >= self.batch_size:
+            self.flush()
+
+    def flush(self, wait: bool = False) -> None:
+        if not self._docs:
+            return
+        docs, digests = self._docs, self._digests
+        # Ask Qdrant (hash payload index) which chunks it already holds for
+        # this tenant, so re-ingesting unchanged files embeds nothing instead
+        # of embedding every chunk only for upsert to discard it.
+        try:
+            existing = self.vector_store.doc_exists_hash(
+                self.tenant_id, [d.metadata["hash"] for d in docs]
+            )
+        except Exception as e:
+            logger.warning("Known-hash prefilter failed, embedding full batch: %s", e)
+            existing = {}
+        if existing:
+            kept = [(d, hb) for d, hb in zip(docs, digests) if not existing.get(d.metadata["hash"])]
+            docs = [d for d, _ in kept]
+            digests = [hb for _, hb in kept]
+        if docs:
+            embs = self.embeddings.embed_texts([d.text for d in docs], digests=digests)
+            self.inserted += self.vector_store.upsert(
+                tenant_id=self.tenant_id,
+                docs=docs,
+                embeddings=embs,
+                # Existence already checked above; skip the redundant lookup.
+                skip_if_exists=False,
+                wait=wait
+            )
+            self._unwaited = None if wait else (docs[-1], embs[-1])
+        self._docs = []
+        self._digests = []
+
+    def finish(self) -> None:
+        # Final batch waits for the server to apply, acting as the barrier
+        # for the fire-and-forget batches sent mid-stream.
+        self.flush(wait=True)
+        if self._unwaited is not None:
+            # The chunk count was an exact multiple of the batch size, so the
+            # waited flush above had nothing to send. Re-upsert the last
+            # fire-and-forget point with wait=True (idempotent by id) so
+            # completion still implies the earlier batches were applied.
+            doc, emb = self._unwaited
+            self.vector_store.upsert(
+                tenant_id=self.tenant_id,
+                docs=[doc],
+                embeddings=[emb],
+                skip_if_exists=False,
+                wait=True,
+            )
+            self._unwaited = None
+        if self.inserted:
+            # New vectors may change retrieval results; drop cached queries for this tenant.
+            from app.chat.query_cache import invalidate_tenant
+            invalidate_tenant(self.tenant_id)
+
+
 def ingest_directory(tenant: TenantContext, directory: str, source_id: str | None = None) -> IngestionStats:
     """
     Ingest all PDF files in a directory into vector store.
+
+    Chunks stream through a _StreamingUpserter so memory stays bounded.
     """
     t0 = time.time()
-    vector_store = get_vector_store()
-    embeddings = get_embedding_service()
+    upserter = _StreamingUpserter(tenant.tenant_id, source_id)
 
     pdf_files = list(_iter_pdf_files(directory))
     total_pages = 0
-    all_chunks: List[Tuple[str, int, int, str]] = []  # (source, page, chunk_index, text)
-
-    for pdf in pdf_files:
-        pages = _load_pdf_texts(pdf)
-        total_pages += len(pages)
-        page_chunks = _chunk_page_texts(pages)
-        for page_num, chunk_idx, text in page_chunks:
-            all_chunks.append((pdf, page_num, chunk_idx, text))
-
-    raw_chunks = len(all_chunks)
-
-    # Prepare docs with metadata & hashes
-    docs: List[VectorDocument] = []
-    hashes: List[str] = []
-    for source, page, cidx, text in all_chunks:
-        h = _hash_text(text)
-        hashes.append(h)
-        # Deterministic UUID v5 based on content hash + page + chunk index for idempotency (Qdrant requires int or UUID)
-        doc_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{h}:{page}:{cidx}"))
-        metadata = {
-            "text": text,
-            "source": os.path.basename(source),
-            "source_path": source,
-            "page": page,
-            "chunk_index": cidx,
-            "hash": h,
-            "created_at": int(time.time())
-        }
-        # Add source_id if provided
-        if source_id:
-            metadata["source_id"] = source_id
-        docs.append(
-            VectorDocument(
-                id=doc_id,
-                text=text,
-                metadata=metadata
-            )
-        )
-
-    # Deduplicate by hash before embedding (save work)
-    seen = set()
-    final_docs: List[VectorDocument] = []
-    for d in docs:
-        h = d.metadata["hash"]
-        if h in seen:
-            continue
-        seen.add(h)
-        final_docs.append(d)
-
-    # Embed (batch)
-    batch_size = settings.embedding_batch_size
-    embeddings_out: List[List[float]] = []
-    for i in range(0, len(final_docs), batch_size):
-        batch_texts = [d.text for d in final_docs[i:i+batch_size]]
-        embeddings_out.extend(embeddings.embed_texts(batch_texts))
-
-    # Upsert
-    inserted = vector_store.upsert(
-        tenant_id=tenant.tenant_id,
-        docs=final_docs,
-        embeddings=embeddings_out,
-        skip_if_exists=True
-    )
+
+    def _consume(chunks: List[Tuple[str, int, int, str, str]]) -> None:
+        for source, page, cidx, text, h in chunks:
+            upserter.add(source, page, cidx, text, h)
+
+    # Parse + chunk files in parallel; PDFium releases the GIL so threads
+    # scale without the pickling cost of a process pool. ex.map is consumed
+    # lazily so only in-flight files are resident.
+    if len(pdf_files) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(pdf_files), os.cpu_count() or 4)) as ex:
+            for page_count, chunks in ex.map(_load_and_chunk, pdf_files):
+                total_pages += page_count
+                _consume(chunks)
+    else:
+        for pdf in pdf_files:
+            page_count, chunks = _load_and_chunk(pdf)
+            total_pages += page_count
+            _consume(chunks)
+
+    upserter.finish()
 
     stats = IngestionStats(
         tenant_id=tenant.tenant_id,
         pdf_files=len(pdf_files),
         pages=total_pages,
-        raw_chunks=raw_chunks,
-        new_chunks=inserted,
-        skipped_duplicates=raw_chunks - inserted,
+        raw_chunks=upserter.raw_chunks,
+        new_chunks=upserter.inserted,
+        skipped_duplicates=upserter.raw_chunks - upserter.inserted,
         elapsed_sec=round(time.time() - t0, 3)
     )
     return stats
 
+
+def ingest_text_content(tenant: TenantContext, text: str, source_path: str,
+                        source_id: str | None = None) -> IngestionStats:
+    """
+    Ingest raw text (e.g. an uploaded .txt file) through the same splitter and
+    streaming embed+upsert path as PDF pages; the text is treated as page 0.
+    """
+    t0 = time.time()
+    upserter = _StreamingUpserter(tenant.tenant_id, source_id)
+
+    norm = _normalize_text(text)
+    pages: List[Tuple[int, str]] = [(0, norm)] if norm else []
+    for page, cidx, chunk in _chunk_page_texts(pages):
+        upserter.add(source_path, page, cidx, chunk)
+    upserter.finish()
+
+    return IngestionStats(
+        tenant_id=tenant.tenant_id,
+        pdf_files=0,
+        pages=len(pages),
+        raw_chunks=upserter.raw_chunks,
+        new_chunks=upserter.inserted,
+        skipped_duplicates=upserter.raw_chunks - upserter.inserted,
+        elapsed_sec=round(time.time() - t0, 3)
+    )
+
 def ingest_single_file(tenant: TenantContext, file_path: str, source_id: str | None = None) -> IngestionStats:
     tmp_dir = os.path.dirname(file_path)
     return ingest_directory(tenant, tmp_dir, source_id)
@@ -1,7 +1,14 @@
 from __future__ import annotations
+import asyncio
+import json
 import logging
-from fastapi import FastAPI, HTTPException, Header, Depends, UploadFile, File
-from fastapi.responses import RedirectResponse, FileResponse
+import uuid
+from contextlib import asynccontextmanager, nullcontext
+import aiofiles
+from fastapi import FastAPI, HTTPException, Header, Depends, UploadFile, File, BackgroundTasks
+import orjson
+from fastapi.responses import RedirectResponse, FileResponse, ORJSONResponse, StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from typing import Optional, List
 from app.core.config import get_settings
 from app.core.tenancy import (
@@ -25,24 +32,84 @@ from app.models.dto import (
     IngestionStatsResponse,
     SearchRequest,
     SearchResponse,
+    SearchBatchRequest,
+    SearchBatchResponse,
     SearchHit,
     ChatRequest,
     ChatResponse,
 )
+from app.chat.query_cache import QueryCache, invalidate_tenant, make_key
 from app.ingestion.pipeline import ingest_directory
 from app.vector.qdrant_store import get_vector_store
-from app.chat.service import rag_chat
+from app.chat.service import arag_chat, rag_chat_stream
 from app.embeddings.factory import get_embedding_service
-from app.core.db import init_pool, run_migrations
+from app.core.db import init_pool, run_migrations, execute, fetch_one, pool_stats
+from app.core.sources import (
+    create_source,
+    delete_source,
+    get_source,
+    get_source_context,
+    iter_documents,
+    iter_sources,
+    list_documents,
+    list_sources,
+    register_document,
+)
 from fastapi.staticfiles import StaticFiles
 import os
-from app.ingestion.pipeline import ingest_single_file
+from app.ingestion.pipeline import ingest_single_file, ingest_text_content
 
 logger = logging.getLogger("app")
 logging.basicConfig(level=logging.INFO)
 
 settings = get_settings()
-app = FastAPI(title="Multi-tenant RAG API", version="0.1.0")
+
+# ---------------- Lifespan ----------------
+
+def _init_db() -> None:
+    # Migrations need the pool, so these two stay sequential within one task;
+    # run_migrations serializes across workers via a pg advisory lock.
+    init_pool()
+    run_migrations()
+
+def _warm_vector_store() -> None:
+    # Constructing the client + probing the collection here means the first
+    # search does not pay that latency; ensure_collections tolerates an
+    # unreachable Qdrant (it logs and defers).
+    get_vector_store().ensure_collections()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # DB setup, vector store probe, and embedding provider init are
+    # independent; run them concurrently so cold start costs the max of the
+    # three rather than the sum.
+    await asyncio.gather(
+        asyncio.to_thread(_init_db),
+        asyncio.to_thread(_warm_vector_store),
+        asyncio.to_thread(get_embedding_service),
+    )
+    # Mount UI (served at /ui/)
+    if not any(r.path == "/ui" for r in app.routes):
+        if os.path.isdir("web"):
+            app.mount("/ui", StaticFiles(directory="web", html=True), name="ui")
+    logger.info("API startup complete (db + vector ready + ui).")
+    yield
+    from app.core.db import close_pool
+    close_pool()
+
+# orjson (Rust) encodes the chunk-heavy search/chat responses several times
+# faster than the stdlib json encoder FastAPI defaults to.
+app = FastAPI(
+    title="Multi-tenant RAG API",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
+
+# Search/chat responses carry full chunk text (tens of KB); gzip cuts them
+# 4-8x on the wire. Level 5 trades a little ratio for low CPU; responses
+# under 1 KB are not worth compressing.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 # ---------------- Dependencies ----------------
 
@@ -72,8 +139,8 @@ def create_tenant(req: TenantCreateRequest):
     return TenantCreateResponse(tenant_id=req.tenant_id)
 
 @app.get("/tenants", response_model=TenantListResponse)
-def list_all_tenants():
-    tenants = sorted(list_tenants())
+async def list_all_tenants():
+    tenants = sorted(await asyncio.to_thread(list_tenants))
     return TenantListResponse(tenants=tenants)
 
 # ---------------- Source Endpoints ----------------
@@ -84,7 +151,6 @@ def create_source_endpoint(
     req: SourceCreateRequest,
     tenant = Depends(tenant_guard),
 ):
-    from app.core.sources import create_source
     try:
         source_id = create_source(tenant.tenant_id, req.source_name)
     except ValueError as e:
@@ -95,13 +161,26 @@ def create_source_endpoint(
         source_name=req.source_name
     )
 
+def _ndjson(rows):
+    # One JSON object per line; rows come off a server-side cursor, so the
+    # response streams in constant memory no matter the table size.
+    for row in rows:
+        yield orjson.dumps(row) + b"\n"
+
 @app.get("/tenants/{tenant_id}/sources", response_model=SourceListResponse)
-def list_sources_endpoint(
+async def list_sources_endpoint(
     tenant_id: str,
+    stream: bool = False,
     tenant = Depends(tenant_guard),
 ):
-    from app.core.sources import list_sources
-    sources = list_sources(tenant.tenant_id)
+    if stream:
+        # ndjson opt-in for huge tenants; the JSON model stays the default
+        # for small result sets and existing clients.
+        return StreamingResponse(
+            _ndjson(iter_sources(tenant.tenant_id)),
+            media_type="application/x-ndjson",
+        )
+    sources = await asyncio.to_thread(list_sources, tenant.tenant_id)
     return SourceListResponse(
         tenant_id=tenant.tenant_id,
         sources=[
@@ -120,28 +199,20 @@ def delete_source_endpoint(
     source_id: str,
     tenant = Depends(tenant_guard),
 ):
-    from app.core.sources import delete_source
     deleted = delete_source(tenant.tenant_id, source_id)
     if not deleted:
         raise HTTPException(status_code=404, detail=f"Source '{source_id}' not found")
-    
-    # Also delete vectors from Qdrant
-    from qdrant_client.http import models as qm
-    vector_store = get_vector_store()
+
+    # Also delete vectors from Qdrant (clears the store's seen-hash cache so
+    # a re-upload of the same documents is re-embedded, not skipped).
     try:
-        vector_store.client.delete(
-            collection_name=vector_store._state.name,
-            points_selector=qm.FilterSelector(
-                filter=qm.Filter(
-                    must=[
-                        qm.FieldCondition(key="tenant_id", match=qm.MatchValue(value=tenant.tenant_id)),
-                        qm.FieldCondition(key="source_id", match=qm.MatchValue(value=source_id))
-                    ]
-                )
-            )
-        )
+        get_vector_store().delete_source(tenant.tenant_id, source_id)
     except Exception as e:
         logger.warning(f"Failed to delete vectors for source {source_id}: {e}")
+
+    # Cached retrieval results may cite the deleted documents; drop them now
+    # rather than serving stale hits for the rest of the cache TTL.
+    invalidate_tenant(tenant.tenant_id)
     
     return SourceDeleteResponse(
         tenant_id=tenant.tenant_id,
@@ -149,18 +220,23 @@ def delete_source_endpoint(
     )
 
 @app.get("/tenants/{tenant_id}/sources/{source_id}/documents", response_model=DocumentListResponse)
-def list_documents_endpoint(
+async def list_documents_endpoint(
     tenant_id: str,
     source_id: str,
+    stream: bool = False,
     tenant = Depends(tenant_guard),
 ):
-    from app.core.sources import list_documents, get_source
     # Validate source exists
-    source = get_source(tenant.tenant_id, source_id)
+    source = await asyncio.to_thread(get_source, tenant.tenant_id, source_id)
     if not source:
         raise HTTPException(status_code=404, detail=f"Source '{source_id}' not found")
-    
-    documents = list_documents(tenant.tenant_id, source_id)
+
+    if stream:
+        return StreamingResponse(
+            _ndjson(iter_documents(tenant.tenant_id, source_id)),
+            media_type="application/x-ndjson",
+        )
+    documents = await asyncio.to_thread(list_documents, tenant.tenant_id, source_id)
     return DocumentListResponse(
         tenant_id=tenant.tenant_id,
         source_id=source_id,
@@ -177,13 +253,70 @@ def list_documents_endpoint(
 
 # ---------------- Ingestion & Upload ----------------
 
+_UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+async def _save_upload(file: UploadFile, target_path: str) -> None:
+    # Stream to disk in bounded chunks (instead of file.read() buffering the
+    # whole upload); aiofiles keeps open/write/close off the event loop.
+    async with aiofiles.open(target_path, "wb") as out:
+        while chunk := await file.read(_UPLOAD_CHUNK_BYTES):
+            await out.write(chunk)
+
+def _ingest_text_file(tenant, target_path: str, source_id: Optional[str] = None):
+    with open(target_path, "r", encoding="utf-8", errors="ignore") as f:
+        text_content = f.read()
+    if not text_content.strip():
+        raise HTTPException(status_code=400, detail="Empty text file.")
+    return ingest_text_content(tenant, text_content, target_path, source_id)
+
+def _ingest_uploaded(tenant, target_path: str, source_id: Optional[str], ext: str):
+    if ext.endswith(".pdf"):
+        return ingest_single_file(tenant, target_path, source_id)
+    return _ingest_text_file(tenant, target_path, source_id)
+
+def _run_ingest_job(tenant, target_path: str, source_id: Optional[str], ext: str, job_id: str) -> None:
+    execute(
+        "UPDATE ingestion_jobs SET status='running', updated_at=NOW() WHERE tenant_id=%s AND job_id=%s",
+        tenant.tenant_id, job_id
+    )
+    try:
+        stats = _ingest_uploaded(tenant, target_path, source_id, ext)
+        execute(
+            "UPDATE ingestion_jobs SET status='done', detail=%s, updated_at=NOW() WHERE tenant_id=%s AND job_id=%s",
+            json.dumps(stats.__dict__), tenant.tenant_id, job_id
+        )
+    except Exception as e:  # noqa
+        logger.exception("Background ingestion job %s failed", job_id)
+        execute(
+            "UPDATE ingestion_jobs SET status='failed', detail=%s, updated_at=NOW() WHERE tenant_id=%s AND job_id=%s",
+            str(e), tenant.tenant_id, job_id
+        )
+
+def _enqueue_ingest_job(background_tasks: BackgroundTasks, tenant, target_path: str,
+                        source_id: Optional[str], ext: str) -> ORJSONResponse:
+    job_id = str(uuid.uuid4())
+    execute("INSERT INTO ingestion_jobs (tenant_id, job_id) VALUES (%s, %s)", tenant.tenant_id, job_id)
+    background_tasks.add_task(_run_ingest_job, tenant, target_path, source_id, ext, job_id)
+    return ORJSONResponse(
+        status_code=202,
+        content={"status": "queued", "job_id": job_id, "tenant_id": tenant.tenant_id}
+    )
+
+def _maybe_bulk(bulk: bool):
+    # ?bulk=true defers HNSW indexing for the duration of a large directory
+    # ingest; interactive single-file uploads keep the default so search
+    # quality is never degraded by a small write.
+    return get_vector_store().bulk_mode() if bulk else nullcontext()
+
 @app.post("/tenants/{tenant_id}/ingest", response_model=IngestionStatsResponse)
 def ingest_directory_endpoint(
     tenant_id: str,
     req: IngestDirectoryRequest,
+    bulk: bool = False,
     tenant = Depends(tenant_guard),
 ):
-    stats = ingest_directory(tenant, req.directory)
+    with _maybe_bulk(bulk):
+        stats = ingest_directory(tenant, req.directory)
     return IngestionStatsResponse(**stats.__dict__)
 
 @app.post("/tenants/{tenant_id}/sources/{source_id}/ingest", response_model=IngestionStatsResponse)
@@ -191,285 +324,265 @@ def ingest_directory_to_source_endpoint(
     tenant_id: str,
     source_id: str,
     req: IngestDirectoryRequest,
+    bulk: bool = False,
     tenant = Depends(tenant_guard),
 ):
-    from app.core.sources import get_source_context
     try:
         source_ctx = get_source_context(tenant.tenant_id, source_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
-    
-    stats = ingest_directory(tenant, req.directory, source_id)
+
+    with _maybe_bulk(bulk):
+        stats = ingest_directory(tenant, req.directory, source_id)
     return IngestionStatsResponse(**stats.__dict__)
 
 @app.post("/tenants/{tenant_id}/sources/{source_id}/upload", response_model=IngestionStatsResponse)
 async def upload_file_to_source_endpoint(
     tenant_id: str,
     source_id: str,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    background: bool = False,
     tenant = Depends(tenant_guard),
 ):
-    from app.core.sources import get_source_context, register_document
     try:
         source_ctx = get_source_context(tenant.tenant_id, source_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
-    
-    settings = get_settings()
+
     upload_dir = os.path.join(settings.storage_root, "uploads", tenant.tenant_id, source_id)
-    os.makedirs(upload_dir, exist_ok=True)
+    await asyncio.to_thread(os.makedirs, upload_dir, exist_ok=True)
     target_path = os.path.join(upload_dir, file.filename)
-    raw = await file.read()
-    with open(target_path, "wb") as f:
-        f.write(raw)
-    
+    await _save_upload(file, target_path)
+
     # Register document in database
-    register_document(tenant.tenant_id, source_id, file.filename, target_path)
-    
+    await asyncio.to_thread(register_document, tenant.tenant_id, source_id, file.filename, target_path)
+
     ext = file.filename.lower()
-    if ext.endswith(".pdf"):
-        stats = ingest_single_file(tenant, target_path, source_id)
-    elif ext.endswith(".txt"):
-        from app.vector.qdrant_store import get_vector_store
-        from app.vector.base import VectorDocument
-        import time, hashlib, uuid
-
-        text_content = raw.decode("utf-8", errors="ignore")
-        if not text_content.strip():
-            raise HTTPException(status_code=400, detail="Empty text file.")
-
-        chunk_size = settings.chunk_size
-        overlap = settings.chunk_overlap
-        chunks: list[str] = []
-        start = 0
-        while start < len(text_content):
-            end = min(start + chunk_size, len(text_content))
-            seg = text_content[start:end].strip()
-            if seg:
-                chunks.append(seg)
-            if end == len(text_content):
-                break
-            start = end - overlap
-
-        embeddings = get_embedding_service()
-        vs = get_vector_store()
-        docs: list[VectorDocument] = []
-        for idx, chunk in enumerate(chunks):
-            h = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
-            doc_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{h}:{idx}"))
-            docs.append(
-                VectorDocument(
-                    id=doc_id,
-                    text=chunk,
-                    metadata={
-                        "text": chunk,
-                        "source": file.filename,
-                        "source_path": target_path,
-                        "source_id": source_id,
-                        "page": 0,
-                        "chunk_index": idx,
-                        "hash": h,
-                        "created_at": int(time.time())
-                    }
-                )
-            )
-        final_docs: list[VectorDocument] = []
-        seen = set()
-        for d in docs:
-            h = d.metadata["hash"]
-            if h in seen:
-                continue
-            seen.add(h)
-            final_docs.append(d)
-        embeddings_out = embeddings.embed_texts([d.text for d in final_docs])
-        inserted = vs.upsert(
-            tenant_id=tenant.tenant_id,
-            docs=final_docs,
-            embeddings=embeddings_out,
-            skip_if_exists=True
-        )
-        from app.ingestion.pipeline import IngestionStats
-        stats = IngestionStats(
-            tenant_id=tenant.tenant_id,
-            pdf_files=0,
-            pages=1,
-            raw_chunks=len(docs),
-            new_chunks=inserted,
-            skipped_duplicates=len(docs) - inserted,
-            elapsed_sec=0.0
-        )
-    else:
+    if not (ext.endswith(".pdf") or ext.endswith(".txt")):
         raise HTTPException(status_code=400, detail="Unsupported file type (only .pdf or .txt).")
 
+    # ?background=true: accept + enqueue so the client gets a 202 and a job id
+    # immediately instead of blocking on parse/embed/upsert.
+    if background:
+        return _enqueue_ingest_job(background_tasks, tenant, target_path, source_id, ext)
+
+    stats = await asyncio.to_thread(_ingest_uploaded, tenant, target_path, source_id, ext)
     return IngestionStatsResponse(**stats.__dict__)
 
 @app.post("/tenants/{tenant_id}/upload", response_model=IngestionStatsResponse)
 async def upload_file_endpoint(
     tenant_id: str,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    background: bool = False,
     tenant = Depends(tenant_guard),
 ):
-    settings = get_settings()
     upload_dir = os.path.join(settings.storage_root, "uploads", tenant.tenant_id)
-    os.makedirs(upload_dir, exist_ok=True)
+    await asyncio.to_thread(os.makedirs, upload_dir, exist_ok=True)
     target_path = os.path.join(upload_dir, file.filename)
-    raw = await file.read()
-    with open(target_path, "wb") as f:
-        f.write(raw)
+    await _save_upload(file, target_path)
 
     ext = file.filename.lower()
-    if ext.endswith(".pdf"):
-        stats = ingest_single_file(tenant, target_path)
-    elif ext.endswith(".txt"):
-        from app.vector.qdrant_store import get_vector_store
-        from app.vector.base import VectorDocument
-        import time, hashlib, uuid
-
-        text_content = raw.decode("utf-8", errors="ignore")
-        if not text_content.strip():
-            raise HTTPException(status_code=400, detail="Empty text file.")
-
-        # Chunk text similar to PDF pipeline
-        chunk_size = settings.chunk_size
-        overlap = settings.chunk_overlap
-        chunks: list[str] = []
-        start = 0
-        while start < len(text_content):
-            end = min(start + chunk_size, len(text_content))
-            seg = text_content[start:end].strip()
-            if seg:
-                chunks.append(seg)
-            if end == len(text_content):
-                break
-            start = end - overlap
-
-        embeddings = get_embedding_service()
-        vs = get_vector_store()
-        docs: list[VectorDocument] = []
-        for idx, chunk in enumerate(chunks):
-            h = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
-            doc_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{h}:{idx}"))
-            docs.append(
-                VectorDocument(
-                    id=doc_id,
-                    text=chunk,
-                    metadata={
-                        "text": chunk,
-                        "source": file.filename,
-                        "source_path": target_path,
-                        "page": 0,
-                        "chunk_index": idx,
-                        "hash": h,
-                        "created_at": int(time.time())
-                    }
-                )
-            )
-        # Deduplicate
-        final_docs: list[VectorDocument] = []
-        seen = set()
-        for d in docs:
-            h = d.metadata["hash"]
-            if h in seen:
-                continue
-            seen.add(h)
-            final_docs.append(d)
-        embeddings_out = embeddings.embed_texts([d.text for d in final_docs])
-        inserted = vs.upsert(
-            tenant_id=tenant.tenant_id,
-            docs=final_docs,
-            embeddings=embeddings_out,
-            skip_if_exists=True
-        )
-        from app.ingestion.pipeline import IngestionStats
-        stats = IngestionStats(
-            tenant_id=tenant.tenant_id,
-            pdf_files=0,
-            pages=1,
-            raw_chunks=len(docs),
-            new_chunks=inserted,
-            skipped_duplicates=len(docs) - inserted,
-            elapsed_sec=0.0
-        )
-    else:
+    if not (ext.endswith(".pdf") or ext.endswith(".txt")):
         raise HTTPException(status_code=400, detail="Unsupported file type (only .pdf or .txt).")
 
-    return IngestionStatsResponse(**stats.__dict__)
+    if background:
+        return _enqueue_ingest_job(background_tasks, tenant, target_path, None, ext)
 
-# ---------------- Search ----------------
+    stats = await asyncio.to_thread(_ingest_uploaded, tenant, target_path, None, ext)
+    return IngestionStatsResponse(**stats.__dict__)
 
-@app.post("/tenants/{tenant_id}/search", response_model=SearchResponse)
-def search_endpoint(
+@app.get("/tenants/{tenant_id}/jobs/{job_id}")
+async def get_job_endpoint(
     tenant_id: str,
-    req: SearchRequest,
+    job_id: str,
     tenant = Depends(tenant_guard),
 ):
+    row = await asyncio.to_thread(
+        fetch_one,
+        "SELECT job_id, status, detail, created_at, updated_at FROM ingestion_jobs WHERE tenant_id=%s AND job_id=%s",
+        tenant.tenant_id, job_id
+    )
+    if not row:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return {
+        "tenant_id": tenant.tenant_id,
+        "job_id": str(row["job_id"]),
+        "status": row["status"],
+        "detail": row["detail"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+# ---------------- Search ----------------
+
+# Collapse identical concurrent searches: the first request does the work,
+# followers await its future, and re-issues within a few seconds are served
+# from a short-TTL cache (short enough that fresh ingests surface quickly).
+_search_results = QueryCache(max_size=256, ttl_seconds=5.0)
+_search_inflight: dict[tuple, asyncio.Future] = {}
+
+def _hits_from_results(results) -> List[SearchHit]:
+    return [
+        SearchHit(
+            id=r.id,
+            text=r.text,
+            score=r.score,
+            source=r.metadata.get("source"),
+            page=r.metadata.get("page"),
+            chunk_index=r.metadata.get("chunk_index"),
+        )
+        for r in results
+    ]
+
+def _run_search(tenant_id: str, req: SearchRequest):
     embeddings = get_embedding_service()
     vector_store = get_vector_store()
-
     emb = embeddings.embed_query(req.query)
-    results = vector_store.search(
-        tenant_id=tenant.tenant_id,
+    return vector_store.search(
+        tenant_id=tenant_id,
         embedding=emb,
         top_k=min(req.top_k, settings.max_search_k),
         score_threshold=req.score_threshold,
         source_ids=req.source_ids
     )
 
-    hits: List[SearchHit] = []
-    for r in results:
-        hits.append(
-            SearchHit(
-                id=r.id,
-                text=r.text,
-                score=r.score,
-                source=r.metadata.get("source"),
-                page=r.metadata.get("page"),
-                chunk_index=r.metadata.get("chunk_index"),
-            )
-        )
+@app.post("/tenants/{tenant_id}/search", response_model=SearchResponse)
+async def search_endpoint(
+    tenant_id: str,
+    req: SearchRequest,
+    tenant = Depends(tenant_guard),
+):
+    # async def keeps this route off anyio's bounded threadpool (the default
+    # concurrency ceiling for sync routes); the blocking embed/search hops
+    # borrow a thread only while they run.
+    key = make_key(tenant.tenant_id, req.query, req.top_k, req.source_ids) + (req.score_threshold,)
+    while True:
+        results = _search_results.get(key)
+        if results is not None:
+            break
+        fut = _search_inflight.get(key)
+        if fut is not None:
+            try:
+                # shield: cancelling this follower must not cancel the shared
+                # future out from under the leader and the other followers.
+                results = await asyncio.shield(fut)
+                break
+            except asyncio.CancelledError:
+                # The leader was cancelled (its client disconnected), not this
+                # request: loop and run the search ourselves, becoming leader
+                # if the slot is free. Re-raise only our own cancellation.
+                if fut.cancelled():
+                    continue
+                raise
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            _search_inflight[key] = fut
+            try:
+                results = await asyncio.to_thread(_run_search, tenant.tenant_id, req)
+            except Exception as e:
+                fut.set_exception(e)
+                fut.exception()  # mark retrieved in case no follower awaits
+                raise
+            else:
+                _search_results.put(key, results)
+                fut.set_result(results)
+                break
+            finally:
+                # Leader cancellation raises BaseException past the except
+                # above; cancel the future so followers wake up and retry
+                # instead of hanging forever.
+                if not fut.done():
+                    fut.cancel()
+                _search_inflight.pop(key, None)
 
     return SearchResponse(
         tenant_id=tenant.tenant_id,
         query=req.query,
-        hits=hits
+        hits=_hits_from_results(results)
+    )
+
+@app.post("/tenants/{tenant_id}/search_batch", response_model=SearchBatchResponse)
+async def search_batch_endpoint(
+    tenant_id: str,
+    req: SearchBatchRequest,
+    tenant = Depends(tenant_guard),
+):
+    if not req.queries:
+        return SearchBatchResponse(tenant_id=tenant.tenant_id, responses=[])
+
+    embeddings = get_embedding_service()
+    vector_store = get_vector_store()
+
+    # One batched embed call plus one Qdrant search_batch round trip for the
+    # whole fan-out, instead of per-query embeds and searches.
+    embs = await asyncio.to_thread(embeddings.embed_texts, [q.query for q in req.queries])
+    queries = [
+        (emb, min(q.top_k, settings.max_search_k), q.score_threshold, q.source_ids)
+        for emb, q in zip(embs, req.queries)
+    ]
+    batches = await asyncio.to_thread(vector_store.search_batch, tenant.tenant_id, queries)
+
+    return SearchBatchResponse(
+        tenant_id=tenant.tenant_id,
+        responses=[
+            SearchResponse(
+                tenant_id=tenant.tenant_id,
+                query=q.query,
+                hits=_hits_from_results(results)
+            )
+            for q, results in zip(req.queries, batches)
+        ]
     )
 
 # ---------------- Chat (RAG) ----------------
 
 @app.post("/tenants/{tenant_id}/chat", response_model=ChatResponse)
-def chat_endpoint(
+async def chat_endpoint(
     tenant_id: str,
     req: ChatRequest,
     tenant = Depends(tenant_guard),
 ):
-    data = rag_chat(
+    data = await arag_chat(
         tenant_id=tenant.tenant_id,
         user_message=req.message,
         session_id=req.session_id,
         top_k=req.top_k,
         include_history=req.include_history,
-        source_ids=req.source_ids
+        source_ids=req.source_ids,
+        persist=req.persist
     )
     return ChatResponse(**data)
 
+@app.post("/tenants/{tenant_id}/chat/stream")
+def chat_stream_endpoint(
+    tenant_id: str,
+    req: ChatRequest,
+    tenant = Depends(tenant_guard),
+):
+    if not settings.enable_streaming:
+        raise HTTPException(status_code=400, detail="Streaming disabled (set ENABLE_STREAMING=true)")
+    gen = rag_chat_stream(
+        tenant_id=tenant.tenant_id,
+        user_message=req.message,
+        session_id=req.session_id,
+        top_k=req.top_k,
+        include_history=req.include_history,
+        source_ids=req.source_ids,
+        persist=req.persist
+    )
+    return StreamingResponse(gen, media_type="text/plain")
+
 # ---------------- Health ----------------
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-# ---------------- Startup ----------------
-
-@app.on_event("startup")
-def on_startup():
-    # Initialize Postgres + run migrations
-    init_pool()
-    run_migrations()
-    # Mount UI (served at /ui/)
-    if not any(r.path == "/ui" for r in app.routes):
-        if os.path.isdir("web"):
-            app.mount("/ui", StaticFiles(directory="web", html=True), name="ui")
-    logger.info("API startup complete (db + vector ready + ui).")
+@app.get("/metrics")
+def metrics():
+    return {"db_pool": pool_stats()}
 
 # ---------------- UI Routes ----------------
 # Serve index directly at root to avoid redirect loops; rely on StaticFiles for /ui/ assets.
@@ -1,61 +1,66 @@
 from __future__ import annotations
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
 
+class _StrictModel(BaseModel):
+    # extra="forbid" skips pydantic's extras bookkeeping and rejects typoed
+    # fields with a 422; frozen since no DTO is mutated after validation.
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
 # ---------- Tenant ----------
 
-class TenantCreateRequest(BaseModel):
+class TenantCreateRequest(_StrictModel):
     tenant_id: str = Field(..., description="Unique tenant identifier")
 
-class TenantCreateResponse(BaseModel):
+class TenantCreateResponse(_StrictModel):
     tenant_id: str
     status: str = "created"
 
-class TenantListResponse(BaseModel):
+class TenantListResponse(_StrictModel):
     tenants: List[str]
 
 # ---------- Source ----------
 
-class SourceCreateRequest(BaseModel):
+class SourceCreateRequest(_StrictModel):
     source_name: str = Field(..., description="Name of the source")
 
-class SourceCreateResponse(BaseModel):
+class SourceCreateResponse(_StrictModel):
     tenant_id: str
     source_id: str
     source_name: str
     status: str = "created"
 
-class SourceResponse(BaseModel):
+class SourceResponse(_StrictModel):
     source_id: str
     source_name: str
     created_at: str
 
-class SourceListResponse(BaseModel):
+class SourceListResponse(_StrictModel):
     tenant_id: str
     sources: List[SourceResponse]
 
-class SourceDeleteResponse(BaseModel):
+class SourceDeleteResponse(_StrictModel):
     tenant_id: str
     source_id: str
     status: str = "deleted"
 
-class DocumentResponse(BaseModel):
+class DocumentResponse(_StrictModel):
     document_id: str
     filename: str
     file_path: str
     uploaded_at: str
 
-class DocumentListResponse(BaseModel):
+class DocumentListResponse(_StrictModel):
     tenant_id: str
     source_id: str
     documents: List[DocumentResponse]
 
 # ---------- Ingestion ----------
 
-class IngestDirectoryRequest(BaseModel):
+class IngestDirectoryRequest(_StrictModel):
     directory: str = Field(..., description="Path containing PDF files")
 
-class IngestionStatsResponse(BaseModel):
+class IngestionStatsResponse(_StrictModel):
     tenant_id: str
     pdf_files: int
     pages: int
@@ -66,13 +71,13 @@ class IngestionStatsResponse(BaseModel):
 
 # ---------- Search ----------
 
-class SearchRequest(BaseModel):
+class SearchRequest(_StrictModel):
     query: str
     top_k: int = 8
     score_threshold: Optional[float] = None
     source_ids: Optional[List[str]] = Field(None, description="Optional list of source IDs to filter search")
 
-class SearchHit(BaseModel):
+class SearchHit(_StrictModel):
     id: str
     text: str
     score: float
@@ -80,22 +85,30 @@ class SearchHit(BaseModel):
     page: Optional[int] = None
     chunk_index: Optional[int] = None
 
-class SearchResponse(BaseModel):
+class SearchResponse(_StrictModel):
     tenant_id: str
     query: str
     hits: List[SearchHit]
 
+class SearchBatchRequest(_StrictModel):
+    queries: List[SearchRequest]
+
+class SearchBatchResponse(_StrictModel):
+    tenant_id: str
+    responses: List[SearchResponse]
+
 # ---------- Chat (RAG) ----------
 
-class ChatRequest(BaseModel):
+class ChatRequest(_StrictModel):
     message: str
     session_id: Optional[str] = None
     top_k: int = 6
     include_history: bool = True
     source_ids: Optional[List[str]] = Field(None, description="Optional list of source IDs to filter search")
+    persist: bool = Field(True, description="Set false for one-shot turns: skips session creation and history persistence")
 
-class ChatResponse(BaseModel):
-    session_id: str
+class ChatResponse(_StrictModel):
+    session_id: Optional[str] = None
     answer: str
     citations: List[str] = []
     used_chunks: int = 0
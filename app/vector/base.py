@@ -3,13 +3,16 @@ from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from typing import Iterable, List, Sequence, Dict, Any, Optional, Tuple
 
-@dataclass
+# slots drops the per-instance __dict__ (~hundreds of bytes each), which adds
+# up across tens of thousands of chunks in flight during a large ingest;
+# frozen because neither type is mutated after construction.
+@dataclass(slots=True, frozen=True)
 class VectorDocument:
     id: str
     text: str
     metadata: Dict[str, Any]
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SearchResult:
     id: str
     text: str
@@ -31,9 +34,11 @@ class VectorStore(ABC):
         docs: Sequence[VectorDocument],
         embeddings: Sequence[Sequence[float]],
         skip_if_exists: bool = True,
+        wait: bool = True,
     ) -> int:
         """
         Insert or update documents (idempotent).
+        wait=False lets the server acknowledge before applying (bulk ingest).
         Returns number of newly inserted docs (skipped duplicates not counted).
         """
         raise NotImplementedError
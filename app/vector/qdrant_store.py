@@ -1,10 +1,16 @@
 from __future__ import annotations
 from typing import Sequence, List, Dict, Any, Optional
+from contextlib import contextmanager
 from dataclasses import dataclass
+from functools import lru_cache
 import logging
+import random
+import threading
+import time
+import xxhash
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as qm
-from .base import VectorStore, VectorDocument, SearchResult
+from .base import VectorStore, VectorDocument, SearchResult, chunk_iter
 from app.core.config import get_settings
 
 logger = logging.getLogger(__name__)
@@ -28,20 +34,82 @@ class QdrantVectorStore(VectorStore):
     """
 
     def __init__(self) -> None:
+        # Explicit connection pool: route handlers run store calls on the
+        # threadpool (asyncio.to_thread), so concurrent tenants fan out over
+        # pooled connections instead of serializing on a single socket.
+        # prefer_grpc skips REST JSON encoding of the 768+-float vectors on
+        # every upsert/search; the client converts qm models to protobuf.
         self.client = QdrantClient(
             url=settings.qdrant_url,
-            api_key=settings.qdrant_api_key
+            api_key=settings.qdrant_api_key,
+            prefer_grpc=settings.qdrant_prefer_grpc,
+            grpc_port=settings.qdrant_grpc_port,
+            # gzip the channel (algorithm enum 2, modest level): bulk upserts
+            # ship MBs of fp32 vectors that compress well, and the few % CPU
+            # matters less than wire time on cross-host deployments.
+            grpc_options={
+                "grpc.default_compression_algorithm": 2,
+                "grpc.default_compression_level": 2,
+            } if settings.qdrant_prefer_grpc else None,
+            pool_size=settings.qdrant_pool_size,
+            timeout=settings.qdrant_timeout,
         )
         self._state = _CollectionState(name=settings.qdrant_collection)
         self._ensured = False
+        self._ensure_lock = threading.Lock()
+        # Local membership cache of (tenant, hash) pairs this process has
+        # inserted or confirmed present; spares doc_exists_hash a round trip
+        # for content it just wrote. 64-bit xxh3 keys keep it ~8B/entry.
+        self._seen_hashes: set[int] = set()
+        self._seen_lock = threading.Lock()
 
     # -------------------------- Internal helpers --------------------------
 
+    @staticmethod
+    def _quantization_config() -> Optional[qm.QuantizationConfig]:
+        """Collection-level quantization from settings (none | scalar | binary)."""
+        mode = settings.quantization.lower()
+        if mode == "scalar":
+            return qm.ScalarQuantization(
+                scalar=qm.ScalarQuantizationConfig(
+                    type=qm.ScalarType.INT8,
+                    always_ram=True,
+                    # Clip the top percentile of component values so outliers
+                    # don't stretch the int8 range and crush resolution.
+                    quantile=0.99,
+                )
+            )
+        if mode == "binary":
+            return qm.BinaryQuantization(binary=qm.BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    @staticmethod
+    def _search_params() -> Optional[qm.SearchParams]:
+        """
+        When quantization is enabled, oversample the quantized candidate set and
+        rescore with original vectors to recover recall.
+        """
+        if settings.quantization.lower() == "none":
+            return None
+        return qm.SearchParams(
+            quantization=qm.QuantizationSearchParams(
+                ignore=False,
+                rescore=True,
+                oversampling=settings.quantization_oversampling,
+            )
+        )
+
     def _ensure_collection(self, vector_size: int) -> None:
         """
         Lazily create collection with given vector_size if missing.
         Idempotent: if exists, verify size; warn if mismatch.
         """
+        with self._ensure_lock:
+            if self._ensured:
+                return
+            self._ensure_collection_locked(vector_size)
+
+    def _ensure_collection_locked(self, vector_size: int) -> None:
         try:
             exists = self.client.collection_exists(self._state.name)
         except Exception as e:
@@ -50,18 +118,47 @@ class QdrantVectorStore(VectorStore):
         if not exists:
             logger.info("Creating Qdrant collection '%s' (size=%d)", self._state.name, vector_size)
             try:
-                self.client.recreate_collection(
+                # create_collection (not recreate_collection): if a racing
+                # worker created it first we must not drop its data. payload_m
+                # adds per-tenant HNSW links so tenant-filtered searches
+                # traverse a dense sub-graph rather than the global one.
+                quantization = self._quantization_config()
+                self.client.create_collection(
                     collection_name=self._state.name,
-                    vectors_config=qm.VectorParams(size=vector_size, distance=self._state.distance)
+                    # With quantization on, searches traverse the in-RAM int8
+                    # copy; the fp32 originals are only read to rescore the
+                    # final top-k, so they can live on disk (4x RAM saving).
+                    vectors_config=qm.VectorParams(
+                        size=vector_size,
+                        distance=self._state.distance,
+                        on_disk=quantization is not None,
+                    ),
+                    hnsw_config=qm.HnswConfigDiff(m=self._HNSW_M, payload_m=self._HNSW_M, ef_construct=100),
+                    quantization_config=quantization,
+                    # Payloads include full chunk text; keep them on disk so
+                    # RAM scales with vectors, not tenant document volume.
+                    on_disk_payload=True,
                 )
             except Exception as e:
-                raise RuntimeError(f"Failed creating collection: {e}") from e
+                # Lost the creation race to another worker: fine, use theirs.
+                try:
+                    if self.client.collection_exists(self._state.name):
+                        logger.info("Collection '%s' already created by a concurrent worker", self._state.name)
+                    else:
+                        raise RuntimeError(f"Failed creating collection: {e}") from e
+                except RuntimeError:
+                    raise
+                except Exception:
+                    raise RuntimeError(f"Failed creating collection: {e}") from e
             # Create payload indexes (optimize later when volumes grow)
             try:
+                # is_tenant makes Qdrant co-locate each tenant's points in
+                # storage, shrinking the candidate set of tenant-filtered
+                # searches instead of scanning interleaved segments.
                 self.client.create_payload_index(
                     self._state.name,
                     field_name="tenant_id",
-                    field_schema=qm.PayloadSchemaType.KEYWORD
+                    field_schema=qm.KeywordIndexParams(type=qm.KeywordIndexType.KEYWORD, is_tenant=True)
                 )
                 self.client.create_payload_index(
                     self._state.name,
@@ -99,30 +196,155 @@ class QdrantVectorStore(VectorStore):
         if self._ensured:
             return
 
+        # Single-flight: under a cold start with parallel searches, only one
+        # thread probes Qdrant; the rest wait on the lock and see _ensured.
+        with self._ensure_lock:
+            if self._ensured:
+                return
+
+            try:
+                exists = self.client.collection_exists(self._state.name)
+            except Exception as e:
+                # If we cannot reach Qdrant, do not raise here; callers will handle as empty.
+                logger.warning("Failed checking collection existence: %s", e)
+                return
+
+            if exists:
+                logger.info("Qdrant collection '%s' exists; enabling read operations", self._state.name)
+                # We intentionally do not attempt to derive vector_size here (qdrant client
+                # surface differs between versions). The important part is allowing searches
+                # to proceed after a restart. vector_size will be set during the first upsert.
+                self._ensured = True
+            else:
+                logger.debug("Qdrant collection '%s' does not exist; will create on first upsert", self._state.name)
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _cached_filter(tenant_id: str, source_ids: tuple[str, ...] | None) -> qm.Filter:
+        # Filters repeat per (tenant, sources) across requests and pydantic
+        # model construction is not free on a hot path; build each shape once.
+        must_conditions = [
+            qm.FieldCondition(key="tenant_id", match=qm.MatchValue(value=tenant_id))
+        ]
+        if source_ids:
+            # One MatchAny set lookup against the source_id keyword index
+            # instead of a should-list evaluated condition by condition.
+            must_conditions.append(
+                qm.FieldCondition(key="source_id", match=qm.MatchAny(any=list(source_ids)))
+            )
+        return qm.Filter(must=must_conditions)
+
+    @staticmethod
+    def _build_filter(tenant_id: str, source_ids: Optional[List[str]] = None) -> qm.Filter:
+        return QdrantVectorStore._cached_filter(tenant_id, tuple(source_ids) if source_ids else None)
+
+    # Payload fields search consumers actually read (chat context, citations,
+    # API hits); asking for just these keeps full-payload extras like 'hash'
+    # and 'created_at' off the wire for every hit.
+    _SEARCH_PAYLOAD = qm.PayloadSelectorInclude(
+        include=["text", "content", "source", "page", "chunk_index", "source_id"]
+    )
+
+    @staticmethod
+    def _result_from_point(p) -> SearchResult:
+        payload = p.payload or {}
+        text = payload.get("text") or payload.get("content") or ""
+        return SearchResult(id=str(p.id), text=text, score=p.score, metadata=payload)
+
+    # Production HNSW connectivity restored after bulk loads (Qdrant default).
+    _HNSW_M = 16
+
+    @contextmanager
+    def bulk_mode(self):
+        """
+        Disable incremental HNSW graph updates (m=0) for the duration of a
+        bulk load, then restore; per Qdrant guidance this avoids paying graph
+        maintenance per batch and lets the optimizer index once afterwards.
+        Search quality degrades only until the optimizer catches up.
+        """
+        disabled = False
         try:
-            exists = self.client.collection_exists(self._state.name)
+            if self._ensured or self.client.collection_exists(self._state.name):
+                self.client.update_collection(
+                    collection_name=self._state.name,
+                    hnsw_config=qm.HnswConfigDiff(m=0),
+                )
+                disabled = True
         except Exception as e:
-            # If we cannot reach Qdrant, do not raise here; callers will handle as empty.
-            logger.warning("Failed checking collection existence: %s", e)
-            return
-
-        if exists:
-            logger.info("Qdrant collection '%s' exists; enabling read operations", self._state.name)
-            # We intentionally do not attempt to derive vector_size here (qdrant client
-            # surface differs between versions). The important part is allowing searches
-            # to proceed after a restart. vector_size will be set during the first upsert.
-            self._ensured = True
-        else:
-            logger.debug("Qdrant collection '%s' does not exist; will create on first upsert", self._state.name)
+            logger.warning("Could not enter bulk mode (continuing indexed): %s", e)
+        try:
+            yield self
+        finally:
+            if disabled:
+                try:
+                    self.client.update_collection(
+                        collection_name=self._state.name,
+                        hnsw_config=qm.HnswConfigDiff(m=self._HNSW_M),
+                    )
+                except Exception as e:
+                    logger.error("Failed restoring HNSW config after bulk mode: %s", e)
 
     # -------------------------- Public API --------------------------
 
+    # Points per upsert request; Qdrant bulk-load guidance favors modest
+    # batches over one giant request that stalls on WAL.
+    _UPSERT_BATCH = 128
+    # Above this, hand the batch to upload_points, which shards it across
+    # parallel workers with built-in retries instead of sequential requests.
+    _BULK_UPLOAD_THRESHOLD = 512
+    _BULK_UPLOAD_PARALLEL = 4
+    # Transient-failure handling for direct upserts (upload_points has its
+    # own max_retries); jittered exponential backoff, then batch bisection.
+    _RETRY_ATTEMPTS = 5
+    _RETRY_BASE_DELAY = 0.5
+    _RETRY_MAX_DELAY = 8.0
+    # Bound on the local (tenant, hash) membership cache (~8MB of keys);
+    # reset wholesale when full — correctness only costs a re-check.
+    _SEEN_MAX = 1_000_000
+    # Points per scroll+delete round when removing a tenant.
+    _DELETE_BATCH = 10_000
+
+    @staticmethod
+    def _seen_key(tenant_id: str, content_hash: str) -> int:
+        return xxhash.xxh3_64_intdigest(f"{tenant_id}\x00{content_hash}".encode())
+
+    def _record_seen(self, keys: List[int]) -> None:
+        with self._seen_lock:
+            if len(self._seen_hashes) + len(keys) > self._SEEN_MAX:
+                self._seen_hashes.clear()
+            self._seen_hashes.update(keys)
+
+    def _upsert_with_retry(self, batch: List[qm.PointStruct], wait: bool) -> None:
+        for attempt in range(1, self._RETRY_ATTEMPTS + 1):
+            try:
+                self.client.upsert(collection_name=self._state.name, points=batch, wait=wait)
+                return
+            except Exception as e:
+                if attempt >= self._RETRY_ATTEMPTS:
+                    raise
+                if attempt >= 2 and len(batch) > 1:
+                    # Repeated failure often means the server is saturated by
+                    # this request's size; bisect and let each half retry.
+                    logger.warning(
+                        "Splitting %d-point batch after repeated upsert failure: %s",
+                        len(batch), e,
+                    )
+                    mid = len(batch) // 2
+                    self._upsert_with_retry(batch[:mid], wait)
+                    self._upsert_with_retry(batch[mid:], wait)
+                    return
+                delay = min(self._RETRY_BASE_DELAY * (2 ** (attempt - 1)), self._RETRY_MAX_DELAY)
+                # Random jitter de-synchronizes retries across workers.
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                logger.warning("Retrying Qdrant upsert (attempt %d): %s", attempt + 1, e)
+
     def upsert(
         self,
         tenant_id: str,
         docs: Sequence[VectorDocument],
         embeddings: Sequence[Sequence[float]],
         skip_if_exists: bool = True,
+        wait: bool = True,
     ) -> int:
         if not docs:
             return 0
@@ -135,7 +357,8 @@ class QdrantVectorStore(VectorStore):
         elif self._state.vector_size and self._state.vector_size != vector_size:
             raise ValueError(f"Inconsistent embedding size. Expected {self._state.vector_size} got {vector_size}")
 
-        # Optionally skip duplicates based on hash metadata if present
+        # Optionally skip duplicates based on hash metadata if present;
+        # doc_exists_hash consults the local membership cache before Qdrant.
         if skip_if_exists:
             hashes = [d.metadata.get("hash") for d in docs if "hash" in d.metadata]
             existing_map: Dict[str, bool] = {}
@@ -152,23 +375,42 @@ class QdrantVectorStore(VectorStore):
         if not docs:
             return 0
 
-        points: List[qm.PointStruct] = []
-        for d, emb in zip(docs, embeddings):
-            payload = dict(d.metadata)
-            payload["tenant_id"] = tenant_id
-            points.append(
-                qm.PointStruct(
-                    id=d.id,
-                    vector=list(emb),
-                    payload=payload
-                )
+        # Single comprehension, one dict literal per point: no append/resize
+        # churn or copy-then-mutate payload step in the hot loop.
+        points: List[qm.PointStruct] = [
+            qm.PointStruct(
+                id=d.id,
+                # tolist() handles numpy float32 rows; list() everything else
+                vector=emb.tolist() if hasattr(emb, "tolist") else list(emb),
+                payload={**d.metadata, "tenant_id": tenant_id},
             )
+            for d, emb in zip(docs, embeddings)
+        ]
 
         try:
-            self.client.upsert(collection_name=self._state.name, points=points, wait=True)
+            if len(points) > self._BULK_UPLOAD_THRESHOLD:
+                self.client.upload_points(
+                    collection_name=self._state.name,
+                    points=points,
+                    batch_size=self._UPSERT_BATCH,
+                    parallel=self._BULK_UPLOAD_PARALLEL,
+                    wait=wait,
+                )
+            else:
+                for batch in chunk_iter(points, self._UPSERT_BATCH):
+                    self._upsert_with_retry(batch, wait)
         except Exception as e:
             raise RuntimeError(f"Qdrant upsert failed: {e}") from e
 
+        # Remember what we just wrote — regardless of skip_if_exists — so the
+        # next dedupe pass (upsert or a direct doc_exists_hash call from the
+        # ingestion pipeline) answers locally.
+        inserted_keys = [
+            self._seen_key(tenant_id, h) for d in docs if (h := d.metadata.get("hash"))
+        ]
+        if inserted_keys:
+            self._record_seen(inserted_keys)
+
         return len(points)
 
     def search(
@@ -187,30 +429,7 @@ class QdrantVectorStore(VectorStore):
             # Nothing indexed yet
             return []
 
-        # Build filter conditions
-        must_conditions = [
-            qm.FieldCondition(
-                key="tenant_id",
-                match=qm.MatchValue(value=tenant_id)
-            )
-        ]
-        
-        # Add source filtering if provided
-        if source_ids:
-            should_conditions = [
-                qm.FieldCondition(
-                    key="source_id",
-                    match=qm.MatchValue(value=source_id)
-                )
-                for source_id in source_ids
-            ]
-            
-            query_filter = qm.Filter(
-                must=must_conditions,
-                should=should_conditions
-            )
-        else:
-            query_filter = qm.Filter(must=must_conditions)
+        query_filter = self._build_filter(tenant_id, source_ids)
 
         # Debug: log key search parameters to help diagnose missing-hit issues
         try:
@@ -218,69 +437,121 @@ class QdrantVectorStore(VectorStore):
                 "Qdrant search called: collection=%s, query_vector_len=%d, top_k=%d, score_threshold=%s, tenant_id=%s, source_ids=%s",
                 self._state.name, len(embedding) if embedding is not None else 0, top_k, score_threshold, tenant_id, source_ids
             )
-            res = self.client.search(
+            res = self.client.query_points(
                 collection_name=self._state.name,
-                query_vector=list(embedding),
+                query=embedding.tolist() if hasattr(embedding, "tolist") else list(embedding),
                 limit=top_k,
-                with_payload=True,
+                with_payload=self._SEARCH_PAYLOAD,
                 with_vectors=False,
                 score_threshold=score_threshold,
-                query_filter=query_filter
+                query_filter=query_filter,
+                search_params=self._search_params()
             )
         except Exception as e:
             logger.error("Qdrant search error: %s", e)
             raise RuntimeError(f"Qdrant search failed: {e}") from e
 
-        out: List[SearchResult] = []
-        for p in res:
-            payload = p.payload or {}
-            text = payload.get("text") or payload.get("content") or ""
-            out.append(
-                SearchResult(
-                    id=str(p.id),
-                    text=text,
-                    score=p.score,
-                    metadata=payload
-                )
+        return [self._result_from_point(p) for p in res.points]
+
+    def search_batch(
+        self,
+        tenant_id: str,
+        queries: Sequence[tuple],
+    ) -> List[List[SearchResult]]:
+        """
+        Run several searches in one round trip via Qdrant's batch API.
+
+        queries: sequence of (embedding, top_k, score_threshold, source_ids)
+        tuples; returns one result list per query, in order.
+        """
+        if not queries:
+            return []
+        if not self._ensured:
+            self.ensure_collections()
+        if not self._ensured:
+            return [[] for _ in queries]
+
+        requests = [
+            qm.QueryRequest(
+                query=emb.tolist() if hasattr(emb, "tolist") else list(emb),
+                filter=self._build_filter(tenant_id, source_ids),
+                limit=top_k,
+                with_payload=self._SEARCH_PAYLOAD,
+                score_threshold=score_threshold,
+                params=self._search_params(),
             )
-        return out
+            for emb, top_k, score_threshold, source_ids in queries
+        ]
+        try:
+            batches = self.client.query_batch_points(collection_name=self._state.name, requests=requests)
+        except Exception as e:
+            logger.error("Qdrant batch search error: %s", e)
+            raise RuntimeError(f"Qdrant batch search failed: {e}") from e
+        return [[self._result_from_point(p) for p in batch.points] for batch in batches]
 
     def delete_tenant(self, tenant_id: str) -> int:
         if not self._ensured:
             return 0
+        # Keys are one-way hashes, so the tenant's entries cannot be removed
+        # selectively; drop the whole membership cache rather than let a
+        # re-ingest of the deleted tenant's content be skipped as duplicate.
+        with self._seen_lock:
+            self._seen_hashes.clear()
+        # Stream-delete in bounded batches: a single filter delete on a large
+        # tenant makes the server tombstone millions of points in one request
+        # and routinely times out. Each scroll+delete-by-id round stays well
+        # inside the client timeout, and we get a real deleted count back.
+        tenant_filter = self._build_filter(tenant_id)
+        deleted = 0
         try:
-            result = self.client.delete(
-                collection_name=self._state.name,
-                points_selector=qm.FilterSelector(
-                    filter=qm.Filter(
-                        must=[
-                            qm.FieldCondition(
-                                key="tenant_id",
-                                match=qm.MatchValue(value=tenant_id)
-                            )
-                        ]
-                    )
+            while True:
+                points, _ = self.client.scroll(
+                    collection_name=self._state.name,
+                    scroll_filter=tenant_filter,
+                    limit=self._DELETE_BATCH,
+                    with_payload=False,
+                    with_vectors=False,
                 )
-            )
-            # Qdrant does not always return count; return -1 unknown deletion count
-            return -1
+                if not points:
+                    break
+                self.client.delete(
+                    collection_name=self._state.name,
+                    points_selector=qm.PointIdsList(points=[p.id for p in points]),
+                    # wait: the next scroll must not see these points again.
+                    wait=True,
+                )
+                deleted += len(points)
+            return deleted
         except Exception as e:
             raise RuntimeError(f"Failed deleting tenant docs: {e}") from e
 
+    def delete_source(self, tenant_id: str, source_id: str) -> None:
+        """
+        Delete all of one source's points for a tenant.
+
+        Any point deletion must invalidate the seen-hash cache, or a
+        re-upload of the same document would be filtered out as "already
+        present" and silently never re-embedded.
+        """
+        if not self._ensured:
+            return
+        with self._seen_lock:
+            self._seen_hashes.clear()
+        try:
+            self.client.delete(
+                collection_name=self._state.name,
+                points_selector=qm.FilterSelector(filter=self._build_filter(tenant_id, [source_id])),
+            )
+        except Exception as e:
+            raise RuntimeError(f"Failed deleting source docs: {e}") from e
+
     def count_tenant(self, tenant_id: str) -> int:
         if not self._ensured:
             return 0
         try:
             count_res = self.client.count(
                 collection_name=self._state.name,
-                count_filter=qm.Filter(
-                    must=[
-                        qm.FieldCondition(
-                            key="tenant_id",
-                            match=qm.MatchValue(value=tenant_id)
-                        )
-                    ]
-                )
+                count_filter=self._build_filter(tenant_id)
             )
             return count_res.count
         except Exception as e:
@@ -293,30 +564,37 @@ class QdrantVectorStore(VectorStore):
     ) -> Dict[str, bool]:
         if not content_hashes:
             return {}
-        if not self._ensured:
-            return {h: False for h in content_hashes}
-
-        # Qdrant filter supports 'should' for OR semantics.
-        conditions = [
-            qm.FieldCondition(
-                key="hash",
-                match=qm.MatchValue(value=h)
-            ) for h in content_hashes
-        ]
+
+        # Local membership cache first: pairs this process inserted or
+        # already confirmed skip the Qdrant round trip entirely.
+        keys = {h: self._seen_key(tenant_id, h) for h in content_hashes}
+        with self._seen_lock:
+            result = {h: k in self._seen_hashes for h, k in keys.items()}
+        unknown = [h for h, seen in result.items() if not seen]
+        if not unknown or not self._ensured:
+            return result
 
         try:
+            # MatchAny is a single indexed set-membership lookup against the
+            # keyword index on 'hash', instead of N OR'd point conditions.
+            # Only the hash comes back per hit (~32 bytes); the rest of the
+            # payload and the vectors never leave the server.
             scroll_iter = self.client.scroll(
                 collection_name=self._state.name,
-                limit=len(content_hashes),
-                with_payload=True,
+                limit=len(unknown),
+                with_payload=qm.PayloadSelectorInclude(include=["hash"]),
+                with_vectors=False,
                 scroll_filter=qm.Filter(
                     must=[
                         qm.FieldCondition(
                             key="tenant_id",
                             match=qm.MatchValue(value=tenant_id)
-                        )
-                    ],
-                    should=conditions
+                        ),
+                        qm.FieldCondition(
+                            key="hash",
+                            match=qm.MatchAny(any=unknown)
+                        ),
+                    ]
                 )
             )
         except Exception as e:
@@ -328,7 +606,11 @@ class QdrantVectorStore(VectorStore):
             if p.payload and "hash" in p.payload:
                 found_hashes.add(p.payload["hash"])
 
-        return {h: (h in found_hashes) for h in content_hashes}
+        if found_hashes:
+            self._record_seen([keys[h] for h in unknown if h in found_hashes])
+        for h in unknown:
+            result[h] = h in found_hashes
+        return result
 
 # Factory helper
 _store_singleton: Optional[QdrantVectorStore] = None
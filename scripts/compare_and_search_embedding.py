@@ -1,48 +1,39 @@
 #!/usr/bin/env python3
 """
 Compute embedding for a test query using the app's embedding service (inside api container),
-then call Qdrant search with that embedding and print results.
+then search via the app's vector store and print results.
 """
-import json, urllib.request, sys, math
-from typing import List
+import sys
 
-QDRANT_SEARCH = "http://qdrant:6333/collections/documents/points/search"
 TEST_QUERY = "amount due"
-
-def post_json(url, payload):
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(url, data=data, headers={"Content-Type":"application/json"})
-    with urllib.request.urlopen(req, timeout=20) as resp:
-        return json.loads(resp.read().decode())
+TENANT_ID = "john"
 
 def main():
     # Import embedding service from app (must run inside api container)
     try:
         from app.embeddings.factory import get_embedding_service
+        from app.vector.qdrant_store import get_vector_store
     except Exception as e:
-        print("Failed importing embedding service:", repr(e))
+        print("Failed importing app services:", repr(e))
         sys.exit(2)
 
     svc = get_embedding_service()
     emb = svc.embed_query(TEST_QUERY)
     print("Computed embedding length:", len(emb))
-    print("embedding[0:8]:", emb[:8])
+    print("embedding[0:8]:", list(emb[:8]))
 
-    payload = {
-        "limit": 5,
-        "with_payload": True,
-        "with_vector": False,
-        "vector": emb,
-        "filter": {
-            "must": [
-                { "key": "tenant_id", "match": { "value": "john" } }
-            ]
-        }
-    }
+    # Going through the store (not raw HTTP) picks up gRPC transport, the
+    # pooled client, cached tenant filters and quantization rescore params,
+    # and skips re-serializing the embedding as JSON.
     try:
-        res = post_json(QDRANT_SEARCH, payload)
-        print("\nQdrant search response (using computed embedding):")
-        print(json.dumps(res, indent=2))
+        store = get_vector_store()
+        results = store.search(tenant_id=TENANT_ID, embedding=emb, top_k=5)
+        print(f"\nSearch results ({len(results)} hits):")
+        for r in results:
+            md = r.metadata
+            print(f"  id={r.id} score={round(r.score, 4)} "
+                  f"source={md.get('source')} page={md.get('page')} chunk={md.get('chunk_index')}")
+            print(f"    {r.text[:160]!r}")
     except Exception as e:
         print("Failed Qdrant search:", repr(e))
         sys.exit(3)
@@ -5,25 +5,31 @@ Run inside the api container (so env / provider keys match).
 2. Compute embedding for a test query using the app's embedding service.
 3. Print lengths and cosine similarity to check whether the API's embedding aligns with stored vectors.
 """
-import json, urllib.request, sys, math
+import json, sys
 from typing import List
 
+import httpx
+import numpy as np
+
 QDRANT_SCROLL = "http://qdrant:6333/collections/documents/points/scroll"
 TEST_QUERY = "amount due"
 
+_client = httpx.Client(timeout=20, transport=httpx.HTTPTransport(retries=3))
+
 def fetch_point():
-    data = json.dumps({"limit":1, "with_vector": True}).encode("utf-8")
-    req = urllib.request.Request(QDRANT_SCROLL, data=data, headers={"Content-Type":"application/json"})
-    with urllib.request.urlopen(req, timeout=20) as resp:
-        return json.loads(resp.read().decode())
+    r = _client.post(QDRANT_SCROLL, json={"limit": 1, "with_vector": True})
+    r.raise_for_status()
+    return r.json()
 
 def cosine(a: List[float], b: List[float]) -> float:
-    dot = sum(x*y for x,y in zip(a,b))
-    na = math.sqrt(sum(x*x for x in a))
-    nb = math.sqrt(sum(x*x for x in b))
+    # BLAS dot/norm instead of Python-level loops over 1536 floats
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    na = np.linalg.norm(a)
+    nb = np.linalg.norm(b)
     if na == 0 or nb == 0:
         return 0.0
-    return dot / (na*nb)
+    return float(np.dot(a, b) / (na * nb))
 
 def main():
     try:
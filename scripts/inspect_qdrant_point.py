@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
-import json, urllib.request, sys
+import json, sys
+
+import httpx
 
 url = "http://localhost:6333/collections/documents/points/scroll"
 payload = {"limit": 1, "with_vector": True}
-data = json.dumps(payload).encode("utf-8")
-req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
 try:
-    with urllib.request.urlopen(req, timeout=10) as resp:
-        body = resp.read().decode()
-        obj = json.loads(body)
+    with httpx.Client(timeout=10, transport=httpx.HTTPTransport(retries=3)) as client:
+        r = client.post(url, json=payload)
+        r.raise_for_status()
+        obj = r.json()
         pts = obj.get("result", {}).get("points", [])
         if not pts:
             print("No points returned")
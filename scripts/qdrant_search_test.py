@@ -4,22 +4,26 @@ Fetch a stored point (with its vector) then run a Qdrant search using that same
 This verifies whether Qdrant's vector search returns matches when indexed_vectors_count is 0.
 Improved error handling to show HTTP error body.
 """
-import json, urllib.request, sys, math, urllib.error
+import json, sys
+
+import httpx
 
 BASE = "http://localhost:6333"
 SCROLL_URL = f"{BASE}/collections/documents/points/scroll"
 SEARCH_URL = f"{BASE}/collections/documents/points/search"
 
-def post_json(url, payload):
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(url, data=data, headers={"Content-Type":"application/json"})
-    try:
-        with urllib.request.urlopen(req, timeout=20) as resp:
-            return json.loads(resp.read().decode())
-    except urllib.error.HTTPError as e:
-        body = e.read().decode(errors="replace")
-        print(f"HTTPError {e.code}: {body}")
-        raise
+# One keep-alive connection for all calls: no TCP handshake per request.
+_client = httpx.Client(timeout=20, transport=httpx.HTTPTransport(retries=3))
+
+def post_json(url, payload=None):
+    if payload is None:
+        r = _client.get(url)
+    else:
+        r = _client.post(url, json=payload)
+    if r.status_code >= 400:
+        print(f"HTTPError {r.status_code}: {r.text}")
+        r.raise_for_status()
+    return r.json()
 
 try:
     # 1) Scroll to get one point with full vector